@@ -0,0 +1,227 @@
+# as_of.py
+
+r'''Stock levels and cash balances as of a past date.
+
+Inventory and Reconcile are date ordered ledgers.  Replaying Inventory gives the stock levels (see
+Items.in_stock), and replaying Reconcile from a "cash", "w/starts" row gives the cash balance (see
+cash_balance.py).
+
+Rather than replaying the full history for every query, the replay state is saved every
+Checkpoint_every rows.  A query starts from the last checkpoint on or before its date and only replays
+the rows after that.  The checkpoints are built on the first query and rebuilt when the table, or a
+table that the replay uses (e.g., Products for pkg_size), changes.
+
+The checkpoints for tables that haven't changed since load_database are also saved next to the database
+file (e.g., beans-as_of.pickle), stamped with that file's mtime and size, so the next process only
+rebuilds them after the database file changes.
+
+    python as_of.py "Jan 13, 26"
+
+Database.as_of(date) returns an As_of object.
+'''
+
+from bisect import bisect_right
+from functools import partial
+from operator import attrgetter
+import os
+import pickle
+
+from row import parse_date
+from table import Database, bills, Loaded_tables
+
+
+Checkpoint_every = 100     # rows
+
+Checkpoints_cache = {}     # {table_name: (tag, Checkpoints)}
+
+
+class Checkpoints:
+    r'''Replays a date ordered list of rows, saving a copy of the state every `every` rows.
+
+    apply(state, row) returns the new state.  copy(state) returns a copy of state that apply won't change.
+
+    If snapshots (from an earlier Checkpoints for the same rows) is given, the rows aren't replayed.
+    '''
+    def __init__(self, rows, initial, apply, copy, every=None, snapshots=None):
+        if every is None:
+            every = Checkpoint_every
+        self.rows = rows
+        self.dates = [row.date for row in rows]
+        self.apply = apply
+        self.copy = copy
+        self.every = every
+        if snapshots is not None:
+            self.snapshots = snapshots
+            return
+        self.snapshots = [copy(initial)]     # state after rows[:i * every]
+        state = initial
+        for i, row in enumerate(rows, 1):
+            state = apply(state, row)
+            if i % every == 0:
+                self.snapshots.append(copy(state))
+
+    def state(self, date):
+        r'''Returns the state after all rows with row.date <= date.
+        '''
+        end = bisect_right(self.dates, date)
+        checkpoint = end // self.every
+        state = self.copy(self.snapshots[checkpoint])
+        for i in range(checkpoint * self.every, end):
+            state = self.apply(state, self.rows[i])
+        return state
+
+def clear_checkpoints():
+    Checkpoints_cache.clear()
+
+def checkpoints_filename(file_stamp):
+    return file_stamp[0][:-4] + '-as_of.pickle'
+
+def read_checkpoints(filename):
+    r'''Returns {table_name: (file_stamp, every, snapshots)} from the checkpoints file, or {} if there isn't
+    one (or it can't be read).
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return {}
+
+def get_checkpoints(database, table_names, build):
+    r'''Returns the cached Checkpoints for database's table_names[0], calling build(database, snapshots)
+    if the cache is out of date.
+
+    table_names lists the tables that the replay uses.  The cache is tagged with their versions, so any
+    change to them rebuilds it.  If none of them have changed since load_database, the snapshots are
+    taken from (or saved to) the checkpoints file.
+    '''
+    tables = [getattr(database, name) for name in table_names]
+    tag = tuple((table.version, table.row_class.changes) for table in tables)
+    cached = Checkpoints_cache.get(table_names[0])
+    if cached is not None and cached[0] == tag:
+        return cached[1]
+    file_stamp = None
+    loaded = [Loaded_tables.get(name) for name in table_names]
+    if all(info is not None and info[1:] == t for info, t in zip(loaded, tag)) \
+       and len(set(info[0] for info in loaded)) == 1:
+        file_stamp = loaded[0][0]
+    snapshots = None
+    if file_stamp is not None:
+        filename = checkpoints_filename(file_stamp)
+        saved = read_checkpoints(filename)
+        if saved.get(table_names[0], (None,))[:2] == (file_stamp, Checkpoint_every):
+            snapshots = saved[table_names[0]][2]
+    checkpoints = build(database, snapshots)
+    if file_stamp is not None and snapshots is None:
+        saved[table_names[0]] = file_stamp, checkpoints.every, checkpoints.snapshots
+        temp_filename = filename + '-new'
+        with open(temp_filename, 'wb') as f:
+            pickle.dump(saved, f)
+        os.replace(temp_filename, filename)
+    Checkpoints_cache[table_names[0]] = tag, checkpoints
+    return checkpoints
+
+def apply_inventory(stock, inv):
+    r'''stock is {item: (units, uncertainty)}.
+    '''
+    stock[inv.item] = inv.apply_to(*stock.get(inv.item, (0, 0)))
+    return stock
+
+def inventory_checkpoints(database, snapshots=None):
+    # stable sort, so same day rows stay in order
+    rows = sorted(database.Inventory.values(), key=attrgetter('date'))
+    return Checkpoints(rows, {}, apply_inventory, dict, snapshots=snapshots)
+
+def apply_reconcile(starts, balance, recon):
+    r'''Returns the cash balance (w/starts) after Reconcile row recon.  Same logic as cash_balance.py,
+    using the "start" rows in the Starts table `starts`.
+
+    The balance is None until the first "cash", "w/starts" row.
+    '''
+    if recon.account == 'cash' and recon.detail == 'w/starts':
+        return recon.copy()
+    if balance is None:
+        return None
+    if recon.type == "Revenue":
+        balance = balance + recon
+        if (recon.account, "start") in starts:
+            balance = balance - starts[recon.account, "start"]
+    elif recon.type == "Expenses":
+        balance = balance - recon
+    return balance
+
+def copy_balance(balance):
+    if balance is None:
+        return None
+    return balance.copy()
+
+def reconcile_checkpoints(database, snapshots=None):
+    return Checkpoints(database.Reconcile, None, partial(apply_reconcile, database.Starts), copy_balance,
+                       snapshots=snapshots)
+
+
+class As_of:
+    r'''Stock levels and cash balances as of the end of `date`.
+
+    These use the current Products pkg_size and the current Starts.
+    '''
+    def __init__(self, database, date):
+        self.date = parse_date(date)
+        self.stock = get_checkpoints(database, ("Inventory", "Items", "Products"),
+                                     inventory_checkpoints).state(self.date)
+        self.cash = get_checkpoints(database, ("Reconcile", "Starts", "Accounts"),
+                                    reconcile_checkpoints).state(self.date)
+        self.starts = bills()
+        for start in database.Starts.lookup(detail='start'):
+            self.starts += start
+
+    def in_stock(self, item):
+        r'''Returns units, uncertainty.
+        '''
+        return self.stock.get(item, (0, 0))
+
+    @property
+    def cash_no_starts(self):
+        if self.cash is None:
+            return None
+        return self.cash - self.starts
+
+
+def run():
+    import argparse
+    import sys
+
+    from table import load_database
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--item", "-i", default=None, help="only show this item")
+    parser.add_argument("date", help='e.g., "Jan 13, 26" or 2026-01-13')
+
+    args = parser.parse_args()
+
+    load_database(tables=("Inventory", "Reconcile", "Starts"))
+
+    as_of = Database.as_of(args.date)
+
+    print(f"As of {as_of.date:%b %d, %y}")
+    print()
+    print("item                |   units|uncer")
+    for item in sorted(as_of.stock.keys()):
+        if args.item is None or item == args.item:
+            units, uncertainty = as_of.stock[item]
+            print(f"{item:20}|{units:8g}|{uncertainty:5}")
+
+    print()
+    if as_of.cash is None:
+        print('No "cash", "w/starts" row in Reconcile by then')
+    else:
+        print("                ", end='')
+        as_of.cash.print_header(sys.stdout)
+        print("cash w/o starts ", end='')
+        as_of.cash_no_starts.print(sys.stdout)
+        print("cash w/starts   ", end='')
+        as_of.cash.print(sys.stdout)
+
+
+
+if __name__ == "__main__":
+    run()
@@ -18,7 +18,7 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Months", "Items", "Inventory"))
 
     table_size = args.table_size
     uncertainty_pct = args.uncertainty
@@ -15,18 +15,17 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Months", "Items", "Inventory"))
 
     today = date.today()
     cur_month = Months[today.year, today.month]
 
     print(f"Calculating estimates effective {today:%b %d, %y}")
 
-    for item in Items.values():
-        units, uncertainty = item.in_stock(args.verbose)
+    for item, (units, uncertainty) in Inventory.stock_levels().items():
         if args.verbose:
-            print(f"Item {item.item}: {units=}, {uncertainty=}")
-        Inventory.insert(date=today, item=item.item, code="estimate", num_units=units,
+            print(f"Item {item}: {units=}, {uncertainty=}")
+        Inventory.insert(date=today, item=item, code="estimate", num_units=units,
                          uncertainty=uncertainty)
 
     if not args.trial_run:
@@ -0,0 +1,213 @@
+# cascade.py
+
+r'''Renames or deletes rows, cascading the change to all of the rows that reference them.
+
+For example, renaming an item changes it in Items, and in the Products, Inventory and Orders rows for
+that item (and in the Items rows that reference those Products).  Deleting only deletes the rows that
+require the deleted rows; optional references (e.g., an item's preferred product) are set to null.
+
+    python cascade.py Items -w item=Bacon --set "item=Turkey bacon"
+    python cascade.py Products -w supplier=Sams --set supplier=Costco
+    python cascade.py Items -w "item=Paper towels" --delete
+
+The rows that reference a row are found through the reverse foreign key indexes (see
+Foreign_key.referencing in table.py).  All of the changes are planned and checked first, so nothing is
+changed if a renamed key would collide with an existing key.  Then each table is updated in one pass.
+'''
+
+from table import get_database, foreign_keys_to, foreign_key_errors, table_unique
+
+
+def new_key(row, changes):
+    r'''Returns row's primary key after changes.
+    '''
+    if row.primary_key is not None:
+        return changes.get(row.primary_key, getattr(row, row.primary_key))
+    return tuple(changes.get(attr, getattr(row, attr)) for attr in row.primary_keys)
+
+def plan_rename(database, table_name, rows, changes):
+    r'''Returns {table_name: {id(row): (row, {attr: new value})}} for rows and the rows that reference
+    them (recursively).
+    '''
+    plan = {}
+    todo = []
+
+    def add(table_name, row, changes):
+        entries = plan.setdefault(table_name, {})
+        if id(row) not in entries:
+            entries[id(row)] = row, {}
+        row_changes = entries[id(row)][1]
+        added = False
+        for attr, value in changes.items():
+            if attr in row_changes:
+                assert row_changes[attr] == value, \
+                       f"plan_rename: {table_name}[{row.key()}].{attr} set to both {row_changes[attr]!r} and {value!r}"
+            elif getattr(row, attr) != value:
+                row_changes[attr] = value
+                added = True
+        if added:
+            todo.append((table_name, row))
+
+    for row in rows:
+        add(table_name, row, changes)
+    while todo:
+        table_name, row = todo.pop()
+        row_changes = plan[table_name][id(row)][1]
+        for fk in foreign_keys_to(table_name):
+            if any(attr in row_changes for attr in fk.attrs):
+                new_values = {attr: row_changes.get(attr, getattr(row, attr)) for attr in fk.attrs}
+                for ref in fk.referencing(fk.extract(row), database):
+                    add(fk.from_table, ref, new_values)
+    return plan
+
+def check_keys(database, plan):
+    r'''Raises KeyError if any of the new keys in plan collide.
+    '''
+    for table_name, entries in plan.items():
+        table = getattr(database, table_name)
+        if not isinstance(table, table_unique):
+            continue
+        old_keys = set()
+        new_keys = set()
+        for row, changes in entries.values():
+            old, new = row.key(), new_key(row, changes)
+            if old != new:
+                old_keys.add(old)
+                if new in new_keys:
+                    raise KeyError(f"{table_name}: two rows renamed to key={new!r}")
+                new_keys.add(new)
+        for key in new_keys:
+            if key in table and key not in old_keys:
+                raise KeyError(f"{table_name}: key={key!r} already exists")
+
+def rename(table_name, rows, changes, database=None):
+    r'''Sets the changes {attr: new value} on rows of table_name, and the referencing attrs of all of
+    the rows that reference them.
+
+    Returns {table_name: number of rows changed}.
+    '''
+    if database is None:
+        database = get_database()
+    plan = plan_rename(database, table_name, rows, changes)
+    check_keys(database, plan)
+    ans = {}
+    for table_name, entries in plan.items():
+        rekey = False
+        for row, changes in entries.values():
+            if new_key(row, changes) != row.key():
+                rekey = True
+            for attr, value in changes.items():
+                setattr(row, attr, value)
+        table = getattr(database, table_name)
+        if rekey and isinstance(table, table_unique):
+            table.rekey()
+        ans[table_name] = len(entries)
+    return ans
+
+def plan_delete(database, table_name, rows):
+    r'''Returns the rows to delete and the rows to set to null, for deleting rows from table_name.
+
+    The rows to delete are {table_name: {id(row): row}}, for rows and the rows that require them
+    (recursively).  Rows that only optionally reference a deleted row (see Foreign_key.null_attrs in
+    table.py) are kept, with their reference set to null: {table_name: {id(row): (row, null_attrs)}}.
+    '''
+    deletes = {table_name: {id(row): row for row in rows}}
+    todo = [(table_name, row) for row in rows]
+    optional = []        # [(fk, row)]
+    while todo:
+        table_name, row = todo.pop()
+        for fk in foreign_keys_to(table_name):
+            if fk.null_attrs:
+                optional.append((fk, row))
+                continue
+            entries = deletes.setdefault(fk.from_table, {})
+            for ref in fk.referencing(fk.extract(row), database):
+                if id(ref) not in entries:
+                    entries[id(ref)] = ref
+                    todo.append((fk.from_table, ref))
+    nulls = {}
+    for fk, row in optional:
+        deleted = deletes.get(fk.from_table, {})
+        entries = nulls.setdefault(fk.from_table, {})
+        for ref in fk.referencing(fk.extract(row), database):
+            if id(ref) not in deleted:
+                entries[id(ref)] = ref, entries.get(id(ref), (ref, ()))[1] + fk.null_attrs
+    return deletes, nulls
+
+def delete(table_name, rows, database=None):
+    r'''Deletes rows from table_name, and all of the rows that require them.  Rows that only optionally
+    reference the deleted rows have the reference set to null instead.
+
+    Returns {table_name: number of rows deleted}, {table_name: number of rows set to null}.
+    '''
+    if database is None:
+        database = get_database()
+    deletes, nulls = plan_delete(database, table_name, rows)
+    deleted = {}
+    for table_name, entries in deletes.items():
+        if entries:
+            getattr(database, table_name).remove_rows(entries.values())
+            deleted[table_name] = len(entries)
+    nulled = {}
+    for table_name, entries in nulls.items():
+        for row, attrs in entries.values():
+            for attr in attrs:
+                setattr(row, attr, None)
+        if entries:
+            nulled[table_name] = len(entries)
+    return deleted, nulled
+
+
+def run():
+    import argparse
+
+    from query import Query, parse_condition
+    from table import load_database, save_database
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trial-run", "-t", action="store_true", default=False)
+    parser.add_argument("--where", "-w", action="append", default=[],
+                        help="name<op>value selecting the rows, may be repeated")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--set", "-s", action="append", default=[], help="name=new value, may be repeated")
+    group.add_argument("--delete", "-d", action="store_true", default=False)
+    parser.add_argument("table")
+
+    args = parser.parse_args()
+
+    load_database()
+
+    database = get_database()
+    table = getattr(database, args.table)
+    rows = list(Query(table).where(*args.where).rows())
+    if not rows:
+        print("No rows selected")
+        return
+
+    if args.delete:
+        counts, nulled = delete(args.table, rows)
+        for table_name, count in nulled.items():
+            print(f"{table_name}: {count} rows set to null")
+        verb = "deleted"
+    else:
+        changes = {}
+        for setting in args.set:
+            name, op, value = parse_condition(setting)
+            assert op == '=', f"--set: expected name=value, got {setting!r}"
+            changes[name] = table.row_class.types[name](value)
+        counts = rename(args.table, rows, changes)
+        verb = "changed"
+
+    for table_name, count in counts.items():
+        print(f"{table_name}: {count} rows {verb}")
+
+    errors = foreign_key_errors(database)
+    assert not errors, "; ".join(errors)
+
+    if not args.trial_run:
+        save_database()
+
+
+
+if __name__ == "__main__":
+    run()
@@ -6,6 +6,7 @@ r'''Appends to Reconcile table:
    <today>|cash|w/starts  |...
 '''
 
+from itertools import dropwhile
 import sys
 
 from database import *
@@ -19,21 +20,18 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Reconcile", "Starts"))
 
-    for i, recon in enumerate(reversed(Reconcile)):
-        if recon.account == 'cash' and recon.detail == 'w/starts':
-            balance = recon.copy()
-            next = len(Reconcile) - i - 1
-            break
-    else:
-        raise AssertionError('"cash", "w/start" not found in Reconcile')
+    w_starts = Reconcile.lookup(account='cash', detail='w/starts')
+    assert w_starts, '"cash", "w/start" not found in Reconcile'
+    last_w_starts = w_starts[-1]
+    balance = last_w_starts.copy()
 
-    if next == len(Reconcile) - 1:
+    if last_w_starts is Reconcile[-1]:
         print("Reconcile already ends in cash_balance -- aborting")
         return
 
-    for recon in Reconcile[next:]:
+    for recon in dropwhile(lambda recon: recon is not last_w_starts, Reconcile.since(last_w_starts.date)):
         if recon.type == "Revenue":
             balance += recon
             if (recon.account, "start",) in Starts:
@@ -53,10 +51,7 @@ def run():
     balance_no_starts = balance.copy()
 
     # Figure out the cash exchange:
-    starts = bills()
-    for start in Starts.values():
-        if start.detail == 'start':
-            balance_no_starts -= start
+    balance_no_starts -= total_starts()
 
     # insert monthly initial balance
     Reconcile.insert(date=eff_date, account="cash", detail="w/o starts", **balance_no_starts.as_attrs())
@@ -27,7 +27,7 @@ def run():
 
     verbose = args.verbose
 
-    load_database()
+    load_database(tables=("Reconcile", "Starts"))
 
     today = date.today()
 
@@ -37,10 +37,7 @@ def run():
     initial_with_starts = last_recon.copy()
 
     # Figure out the cash exchange:
-    starts = bills()
-    for start in Starts.values():
-        if start.detail == 'start':
-            starts += start
+    starts = total_starts()
 
     initial_balance = initial_with_starts - starts   # ending_minimums don't include starts...
     target = initial_balance.copy()
@@ -0,0 +1,172 @@
+# check.py
+
+r'''Checks the integrity of the database.
+
+    python check.py          # prints the errors, exit status 1 if there are any
+
+This checks:
+
+  - the foreign keys (see Foreign_key in table.py), including Orders -> Products
+  - that the keys of the table_unique tables are unique and match their rows
+  - the column constraints (see row.constraints)
+  - that the Inventory codes are ones that Items.in_stock understands, and that rows with num_pkgs have
+    a pkg_size
+  - that no item's stock goes negative when its Inventory rows are replayed
+  - that each Reconcile "cash|w/starts" row matches the running balance since the last one
+  - that each month starts the day after the previous month ends
+  - that each of the Orders has a product (Orders.csv is read if it exists)
+
+Each table is read once.  The stock levels and cash balance are kept as running totals, so the whole
+check is linear in the size of the database.
+'''
+
+from datetime import timedelta
+from operator import attrgetter
+
+from database import *
+from table import foreign_key_errors, read_side_file, table_unique
+
+
+def check_keys(database):
+    r'''Returns errors for table_unique rows whose key doesn't match, or is duplicated.
+    '''
+    errors = []
+    for table_name in Tables:
+        table = getattr(database, table_name)
+        if not isinstance(table, table_unique):
+            continue
+        keys = set()
+        for key, row in table.items():
+            row_key = row.key()
+            if row_key != key:
+                errors.append(f"{table_name}[{key!r}]: row has key={row_key!r}")
+            if row_key in keys:
+                errors.append(f"{table_name}: duplicate key={row_key!r}")
+            keys.add(row_key)
+    return errors
+
+def check_constraints(database):
+    r'''Returns errors for rows that break their table's constraints (see row.constraints).
+    '''
+    errors = []
+    for table_name in Tables:
+        table = getattr(database, table_name)
+        errors.extend(table.constraint_errors(list(table.values())))
+    return errors
+
+def check_inventory(database):
+    r'''Returns errors for unknown Inventory codes, and for stock that goes negative.
+
+    The rows are replayed in date order, like Items.in_stock and as_of.py.
+    '''
+    errors = []
+    codes = database.Inventory.row_class.codes
+    units = {}        # {item: units in stock}
+    # stable sort, so same day rows stay in order
+    for inv in sorted(database.Inventory.values(), key=attrgetter('date')):
+        if inv.code not in codes:
+            errors.append(f"Inventory[{inv.date:%b %d, %y}, {inv.item}]: unknown code={inv.code!r}")
+            continue
+        if inv.num_pkgs and inv.pkg_size is None:
+            errors.append(f"Inventory[{inv.date:%b %d, %y}, {inv.item}, {inv.code}]: num_pkgs={inv.num_pkgs:g}, "
+                          "but the item has no product with a pkg_size")
+            continue
+        stock, _ = inv.apply_to(units.get(inv.item, 0), 0)
+        if stock < 0 <= units.get(inv.item, 0):
+            errors.append(f"Inventory[{inv.date:%b %d, %y}, {inv.item}, {inv.code}]: stock goes negative ({stock:g})")
+        units[inv.item] = stock
+    return errors
+
+def check_reconcile(database):
+    r'''Returns errors for "cash|w/starts" rows that don't match the running balance.
+
+    The balance is figured the same way as cash_balance.py, by totals rather than by bills.
+    '''
+    errors = []
+    starts = {start.account: start.total for start in database.Starts.lookup(detail='start')}
+    balance = None
+    for recon in database.Reconcile:
+        if recon.account == "cash" and recon.detail == "w/starts":
+            total = bills.total.fget(recon)
+            if balance is not None and total != balance:
+                errors.append(f"Reconcile[{recon.date:%b %d, %y}, cash, w/starts]: total={total}, "
+                              f"expected {balance}")
+            balance = total
+        elif balance is not None:
+            if recon.type == "Revenue":
+                balance += bills.total.fget(recon) - starts.get(recon.account, 0)
+            elif recon.type == "Expenses":
+                balance -= bills.total.fget(recon)
+    return errors
+
+def check_months(database):
+    r'''Returns errors for months that don't start the day after the previous month ends.
+    '''
+    errors = []
+    prev = None
+    for month in sorted(database.Months.values(), key=lambda month: (month.year, month.month)):
+        if month.start_date is not None and month.end_date is not None and month.start_date > month.end_date:
+            errors.append(f"Months[{month.month_str}]: start_date={month.start_date:%b %d, %y} is after "
+                          f"end_date={month.end_date:%b %d, %y}")
+        if prev is not None and prev.end_date is not None and month.start_date is not None and \
+           month.start_date != prev.end_date + timedelta(days=1):
+            errors.append(f"Months[{month.month_str}]: start_date={month.start_date:%b %d, %y} is not the day "
+                          f"after {prev.month_str} end_date={prev.end_date:%b %d, %y}")
+        prev = month
+    return errors
+
+def check_orders(database):
+    r'''Returns errors for Orders without a product (the foreign keys catch the other bad products).
+    '''
+    errors = []
+    for order in database.Orders:
+        if (order.supplier is None or order.supplier_id is None) and order.item in database.Items and \
+           order.product is None:
+            errors.append(f"Orders[{order.item}]: item has no product")
+    return errors
+
+Checks = (check_keys, check_constraints, check_inventory, check_reconcile, check_months, check_orders)
+
+def check_database(database=None):
+    r'''Runs all of the Checks.  Returns a list of error messages.
+
+    A check that can't finish (e.g., because of a missing row) is reported as an error too.
+    '''
+    if database is None:
+        database = get_database()
+    errors = foreign_key_errors(database)
+    for check in Checks:
+        try:
+            errors.extend(check(database))
+        except (KeyError, AttributeError, TypeError) as e:
+            # e.g., rows referencing missing rows, already reported above
+            errors.append(f"{check.__name__}: stopped by {e.__class__.__name__}: {e}")
+    return errors
+
+
+def run():
+    import argparse
+    import os.path
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders-csv-file", "-o", default="Orders.csv")
+
+    args = parser.parse_args()
+
+    load_database(skip_fk_check=True)
+    if os.path.exists(args.orders_csv_file):
+        Orders.insert_many(list(read_side_file(args.orders_csv_file, Orders.row_class)), skip_fk_check=True)
+
+    errors = check_database()
+    for error in errors:
+        print(error)
+    if errors:
+        print("Total errors:", len(errors))
+        sys.exit(1)
+    print("No errors found")
+
+
+
+if __name__ == "__main__":
+    run()
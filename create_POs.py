@@ -2,9 +2,7 @@
 
 from datetime import date, timedelta
 from collections import defaultdict
-from operator import itemgetter
 from itertools import groupby
-import csv
 
 from database import *
 from report import *
@@ -20,7 +18,7 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Months", "Items", "Products"))
 
     today = date.today()
 
@@ -33,41 +31,18 @@ def run():
     bf_date = cur_month.breakfast_date
     po_num = f"{str(bf_date.year)[2:]}{bf_date.month:02}{args.po_num_index}"
 
-    with open("Orders.csv", "r") as f:
-        csv_reader = iter(csv.reader(f, CSV_dialect, **CSV_format))
-        table_name = next(csv_reader)
-        assert table_name == ["Orders"], f'Expected table_name="Orders", got {table_name}'
-        headers = [hdr.strip() for hdr in next(csv_reader)]
-        
-        def read_rows():
-            for row in csv_reader:
-                assert len(headers) == len(row), f"read_rows: {len(headers)=} != {len(row)=}"
-                row_attrs = {}
-                for name, value in zip(headers, row):
-                    value = value.strip()
-                    if value == '':
-                        value = None
-                    if name == 'qty':
-                        value = int(value)
-                    row_attrs[name] = value
-                if row_attrs["supplier"] is None and row_attrs["supplier_id"] is None:
-                    item = Items[row_attrs["item"]]
-                    row_attrs["supplier"] = item.supplier
-                    row_attrs["supplier_id"] = item.supplier_id
-                row_attrs["product"] = Products[row_attrs["item"], row_attrs["supplier"], row_attrs["supplier_id"]]
-               #print(f"read_rows: item={value=}, {item.supplier=}")
-                yield row_attrs
-
-        set_canvas("Purchase-Orders-" + str(po_num), landscape=True)
-        reports = {}  # {supplier: report}
-        grand_total = 0
-        for supplier, items in groupby(sorted(read_rows(), key=itemgetter("supplier", "item")),
-                                       key=itemgetter("supplier")):
-           #print(f"in for: {supplier=}")
-            report, total = gen_PO(supplier, items, po_num, bf_date)
-            if total:
-                reports[supplier] = report
-                grand_total += total
+    orders = [order for order in read_side_file("Orders.csv", Orders.row_class) if order.qty is not None]
+
+    set_canvas("Purchase-Orders-" + str(po_num), landscape=True)
+    reports = {}  # {supplier: report}
+    grand_total = 0
+    for supplier, items in groupby(sorted(orders, key=lambda order: (order.product.supplier, order.item)),
+                                   key=lambda order: order.product.supplier):
+       #print(f"in for: {supplier=}")
+        report, total = gen_PO(supplier, items, po_num, bf_date)
+        if total:
+            reports[supplier] = report
+            grand_total += total
 
     total_report = gen_Total_POs(grand_total, po_num, bf_date)
 
@@ -136,8 +111,8 @@ def gen_PO(supplier, items, po_num, bf_date):
     total = 0
     for line, item in enumerate(items, 1):
        #print(f"gen_PO: {item=}")
-        qty = item["qty"]
-        product = item["product"]
+        qty = item.qty
+        product = item.product
         price = product.price
         ext_price = qty * price
         total += ext_price
@@ -26,7 +26,7 @@ def run():
     table_size = args.table_size
     verbose = args.verbose.split(',')
 
-    load_database()
+    load_database(tables=("Months", "Items", "Inventory"))
 
     cur_month = list(Months.values())[-1]
     print(f"cur_month={cur_month.month_str}")
@@ -39,9 +39,10 @@ def run():
 
     with open("Inv-checklist.csv", "w") as f:
         print(f"{'item':{width}}|unit         |pkg_size|num_pkgs|num_units", file=f)
+        stock = Inventory.stock_levels()
         for i in sorted(Items.values(), key=attrgetter('item')):
             try:
-                i.order(cur_month, table_size, verbose=i.item in verbose)
+                i.order(cur_month, table_size, verbose=i.item in verbose, stock=stock[i.item])
             except CheckInventory:
                 print(f"{i.item:{width}}|{i.unit:13}|{i.pkg_size:8}|        | ", file=f)
 
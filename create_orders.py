@@ -14,7 +14,7 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Months", "Items", "Inventory"))
 
     cur_month = Months.last_month()
     if not cur_month.served_fudge:
@@ -55,8 +55,10 @@ def run():
         print("Orders", file=orders_file)
         print("item                |qty |supplier|supplier_id|purchased_pkgs|purchased_units|"
               "location|price", file=orders_file)
+        stock = Inventory.stock_levels()
         for item in Items.values():
-            order_stats = item.order_stats(cur_month, table_size, override=True, verbose=verbose)
+            order_stats = item.order_stats(cur_month, table_size, override=True, verbose=verbose,
+                                           stock=stock[item.item])
             print(f"{order_stats.item:20}|",
                   f"{order_stats.unit:13}|",
                   f"{order_stats.pkg_size:6}|",
@@ -80,6 +82,10 @@ def run():
                 print(f"{order_stats.item:20}|{order_stats.order:4}|        |           |"
                       "              |               |        |", file=orders_file)
 
+    if verbose:
+        for name, hits, misses, size in cache_stats():
+            print(f"cache {name}: {hits=}, {misses=}, {size=}")
+
 
 
 if __name__ == "__main__":
@@ -23,3 +23,5 @@ Starts = Tables['Starts']
 
 Reconcile = Tables['Reconcile']
 
+Imports = Tables['Imports']
+
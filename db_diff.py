@@ -0,0 +1,351 @@
+# db_diff.py
+
+r'''Row level diff between two database files (or a file and the database in memory).
+
+The values are compared after stripping, so re-padding a column in to_csv doesn't show up as a change.
+
+Rows are matched by the table's primary key.  Tables without a primary key (e.g., Reconcile) are matched
+by date, and within each date by position, after lining up the rows that didn't change.  The rows are
+compared as tuples of strings, so unchanged tables and rows cost one linear pass.
+
+The differences can also be written as a patch, and the patch applied to the database:
+
+    python db_diff.py beans-save.csv                     # compares to beans.csv
+    python db_diff.py old.csv new.csv --patch changes.patch
+    python db_diff.py --apply changes.patch [--trial-run]
+
+Patch lines are pipe delimited: op|table|name=value|...  The op is "+" (insert), "-" (delete) or "~"
+(modify).  Inserts have all of the non-empty values; deletes and modifies start with the key values.
+Tables without a primary key use date and "@" (position within the date) as the key.  Modifies then
+list the changed values as name=old=>new, with each '>' and '\' in old and new escaped by a '\' (so a
+value can't contain the "=>").  The old values are checked when the patch is applied.
+Lines starting with "#" are comments (see sync.py).
+'''
+
+from difflib import SequenceMatcher
+import csv
+import re
+
+from table import Tables, table_by_date, load_database, save_database, CSV_dialect, CSV_format, \
+                  Database_filename
+from row import parse_date
+
+
+Escape_re = re.compile(r'([>\\])')     # escaped in the old and new values of modifies
+Unescape_re = re.compile(r'\\(.)')
+
+
+class Raw_table:
+    r'''A table as stripped strings, straight from a database file (or snapshot).
+    '''
+    def __init__(self, name, header, rows=None):
+        self.name = name
+        self.header = tuple(header)
+        self.rows = rows if rows is not None else []    # [tuple of str]
+
+    def normalize(self, columns):
+        r'''Returns rows as tuples of values in `columns` order.  Missing columns are ''.
+        '''
+        if self.header == columns:
+            return self.rows
+        indexes = [self.header.index(col) if col in self.header else None for col in columns]
+        return [tuple('' if i is None else row[i] for i in indexes) for row in self.rows]
+
+def read_database(csv_filename=Database_filename):
+    r'''Returns {table_name: Raw_table} for all tables in the database file.
+    '''
+    ans = {}
+    with open(csv_filename, 'r') as f:
+        reader = iter(csv.reader(f, CSV_dialect, **CSV_format))
+        for name_row in reader:
+            if len(name_row) == 0:
+                continue
+            assert len(name_row) == 1, f"read_database: Expected table name, got {name_row=}"
+            header = tuple(name.strip().lower() for name in next(reader))
+            table = Raw_table(name_row[0].strip(), header)
+            for row in reader:
+                if len(row) == 0:
+                    break
+                assert len(row) == len(header), \
+                       f"read_database({table.name}): len(header)={len(header)} != len(row)={len(row)}"
+                table.rows.append(tuple(value.strip() for value in row))
+            ans[table.name] = table
+    return ans
+
+def snapshot():
+    r'''Returns {table_name: Raw_table} for the database tables in memory.
+    '''
+    ans = {}
+    for table in Tables.values():
+        if table.row_class.in_database:
+            header = tuple(table.row_class.types.keys())
+            ans[table.name] = Raw_table(table.name, header,
+                                        [tuple(row.csv_value(name) for name in header)
+                                         for row in table.values()])
+    return ans
+
+
+class Table_diff:
+    r'''The differences in one table.
+
+    key_cols are the names of the values in each key.  Rows are tuples of values in `columns` order.
+    '''
+    def __init__(self, name, columns, key_cols):
+        self.name = name
+        self.columns = columns
+        self.key_cols = key_cols
+        self.inserted = []   # [(key, row)]
+        self.deleted = []    # [(key, row)]
+        self.modified = []   # [(key, old_row, new_row)]
+
+    def __bool__(self):
+        return bool(self.inserted or self.deleted or self.modified)
+
+    def changes(self, old_row, new_row):
+        r'''Returns [(col, old, new)] for the changed values.
+        '''
+        return [(col, old, new) for col, old, new in zip(self.columns, old_row, new_row) if old != new]
+
+    def print(self, file=None):
+        print(f"{self.name}: {len(self.inserted)} inserted, {len(self.deleted)} deleted, "
+              f"{len(self.modified)} modified", file=file)
+        for key, row in self.inserted:
+            print("  +", format_values(self.key_cols, key), "|", format_values(self.columns, row), file=file)
+        for key, row in self.deleted:
+            print("  -", format_values(self.key_cols, key), "|", format_values(self.columns, row), file=file)
+        for key, old_row, new_row in self.modified:
+            print("  ~", format_values(self.key_cols, key), "|",
+                  ", ".join(f"{col}: {old!r} -> {new!r}" for col, old, new in self.changes(old_row, new_row)),
+                  file=file)
+
+def format_values(names, values):
+    return ", ".join(f"{name}={value}" for name, value in zip(names, values) if value != '')
+
+def primary_key_columns(table_name):
+    if table_name not in Tables:
+        return None
+    row_class = Tables[table_name].row_class
+    if row_class.primary_key is not None:
+        return (row_class.primary_key,)
+    if row_class.primary_keys is not None:
+        return tuple(row_class.primary_keys)
+    return None
+
+def diff_table(name, old, new):
+    r'''Returns a Table_diff of Raw_tables old and new (either may be None).
+    '''
+    header = old.header if old is not None else ()
+    if new is not None:
+        header += tuple(col for col in new.header if col not in header)
+    old_rows = old.normalize(header) if old is not None else []
+    new_rows = new.normalize(header) if new is not None else []
+    key_cols = primary_key_columns(name)
+    if key_cols is not None and all(col in header for col in key_cols):
+        diff = Table_diff(name, header, key_cols)
+        if old_rows != new_rows:
+            diff_by_key(diff, old_rows, new_rows)
+    else:
+        diff = Table_diff(name, header, ("date", "@"))
+        if old_rows != new_rows:
+            diff_by_position(diff, old_rows, new_rows)
+    return diff
+
+def diff_by_key(diff, old_rows, new_rows):
+    key_indexes = [diff.columns.index(col) for col in diff.key_cols]
+    def by_key(rows):
+        return {tuple(row[i] for i in key_indexes): row for row in rows}
+    old_map = by_key(old_rows)
+    new_map = by_key(new_rows)
+    for key, old_row in old_map.items():
+        new_row = new_map.get(key)
+        if new_row is None:
+            diff.deleted.append((key, old_row))
+        elif new_row != old_row:
+            diff.modified.append((key, old_row, new_row))
+    for key, new_row in new_map.items():
+        if key not in old_map:
+            diff.inserted.append((key, new_row))
+
+def group_by_date(columns, rows):
+    r'''Returns {date: [row]}, keeping the rows in order.  Tables without a date are one group.
+    '''
+    date_index = columns.index("date") if "date" in columns else None
+    ans = {}
+    for row in rows:
+        ans.setdefault('' if date_index is None else row[date_index], []).append(row)
+    return ans
+
+def diff_by_position(diff, old_rows, new_rows):
+    r'''The keys are (date, position within date).  Deletes and modifies use the old position, inserts
+    use the new position.
+    '''
+    old_groups = group_by_date(diff.columns, old_rows)
+    new_groups = group_by_date(diff.columns, new_rows)
+    for date in list(old_groups.keys()) + [date for date in new_groups.keys() if date not in old_groups]:
+        old_group = old_groups.get(date, [])
+        new_group = new_groups.get(date, [])
+        if old_group == new_group:
+            continue
+        matcher = SequenceMatcher(None, old_group, new_group, autojunk=False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == 'equal':
+                continue
+            num_modified = min(i2 - i1, j2 - j1) if op == 'replace' else 0
+            for k in range(num_modified):
+                diff.modified.append(((date, str(i1 + k)), old_group[i1 + k], new_group[j1 + k]))
+            for i in range(i1 + num_modified, i2):
+                diff.deleted.append(((date, str(i)), old_group[i]))
+            for j in range(j1 + num_modified, j2):
+                diff.inserted.append(((date, str(j)), new_group[j]))
+
+def diff_databases(old_tables, new_tables):
+    r'''Returns [Table_diff] for the tables that differ.
+
+    old_tables and new_tables are {table_name: Raw_table}, from read_database or snapshot.
+    '''
+    ans = []
+    for name in list(old_tables.keys()) + [name for name in new_tables.keys() if name not in old_tables]:
+        diff = diff_table(name, old_tables.get(name), new_tables.get(name))
+        if diff:
+            ans.append(diff)
+    return ans
+
+
+def escape(value):
+    r'''Escapes the old and new values in name=old=>new, see unescape.
+    '''
+    return Escape_re.sub(r'\\\1', value)
+
+def unescape(value):
+    return Unescape_re.sub(r'\1', value)
+
+
+def write_patch(diffs, file):
+    for diff in diffs:
+        for key, row in diff.inserted:
+            values = [f"{col}={value}" for col, value in zip(diff.columns, row) if value != '']
+            if diff.key_cols == ("date", "@"):
+                values.insert(0, f"@={key[1]}")
+            print('|'.join(["+", diff.name] + values), file=file)
+        for key, row in diff.deleted:
+            print('|'.join(["-", diff.name] + [f"{col}={value}" for col, value in zip(diff.key_cols, key)]),
+                  file=file)
+        for key, old_row, new_row in diff.modified:
+            print('|'.join(["~", diff.name]
+                           + [f"{col}={value}" for col, value in zip(diff.key_cols, key)]
+                           + [f"{col}={escape(old)}=>{escape(new)}" for col, old, new in diff.changes(old_row, new_row)]),
+                  file=file)
+
+def read_patch(patch_filename):
+    r'''Returns {table_name: {op: [[(name, value)]]}}.
+    '''
+    ans = {}
+    with open(patch_filename, 'r') as f:
+        for line_num, row in enumerate(csv.reader(f, CSV_dialect, **CSV_format), 1):
+            if len(row) == 0 or row[0].startswith('#'):
+                continue
+            assert len(row) >= 3 and row[0] in ("+", "-", "~"), f"read_patch: bad line {line_num}: {row=}"
+            pairs = []
+            for field in row[2:]:
+                name, eq, value = field.partition('=')
+                assert eq, f"read_patch: line {line_num}, expected name=value, got {field=}"
+                pairs.append((name.strip(), value))
+            ans.setdefault(row[1].strip(), {}).setdefault(row[0], []).append(pairs)
+    return ans
+
+def typed_key(row_class, pairs):
+    values = [row_class.types[name](value) for name, value in pairs]
+    if row_class.primary_key is not None:
+        return values[0]
+    return tuple(values)
+
+def set_value(row, name, old, new, where):
+    current = row.csv_value(name)
+    assert current == old, f"apply_patch: {where}.{name} is {current!r}, expected {old!r}"
+    if new == '':
+        if name in row.__dict__:
+            setattr(row, name, getattr(type(row), name))   # back to class default
+    else:
+        setattr(row, name, row.types[name](new))
+
+def modify(row, changes, where):
+    for name, old_new in changes:
+        old, arrow, new = old_new.partition('=>')
+        assert arrow, f"apply_patch: {where}, expected {name}=old=>new, got {old_new=}"
+        set_value(row, name, unescape(old), unescape(new), where)
+
+def apply_patch(patch_filename):
+    r'''Applies the patch to the database tables in memory.
+
+    Returns the number of foreign key errors found afterwards.
+    '''
+    errors = 0
+    for table_name, ops in read_patch(patch_filename).items():
+        table = Tables[table_name]
+        row_class = table.row_class
+        if isinstance(table, table_by_date):
+            def index(pairs):
+                r'''pairs starts with (date, @).
+                '''
+                return table.first_date(parse_date(pairs[0][1])) + int(pairs[1][1])
+            for pairs in ops.get("~", ()):
+                modify(table[index(pairs)], pairs[2:], f"{table_name}[{pairs[0][1]}, @{pairs[1][1]}]")
+            for pairs in sorted(ops.get("-", ()), key=lambda pairs: int(pairs[1][1]), reverse=True):
+                del table[index(pairs)]
+            for pairs in sorted(ops.get("+", ()), key=lambda pairs: int(pairs[0][1])):
+                pos = int(pairs[0][1])
+                new_row = row_class.from_csv([name for name, _ in pairs[1:]], [value for _, value in pairs[1:]])
+                table.insert_at(table.first_date(new_row.date) + pos, new_row)
+        else:
+            num_keys = len(primary_key_columns(table_name))
+            for pairs in ops.get("~", ()):
+                key = typed_key(row_class, pairs[:num_keys])
+                modify(table[key], pairs[num_keys:], f"{table_name}[{key}]")
+            for pairs in ops.get("-", ()):
+                del table[typed_key(row_class, pairs)]
+            for pairs in ops.get("+", ()):
+                table.insert_from_csv([name for name, _ in pairs], [value for _, value in pairs],
+                                      skip_fk_check=True)
+    for table in Tables.values():
+        errors += table.check_foreign_keys()
+    return errors
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patch", "-p", default=None, help="write the differences to this patch file")
+    parser.add_argument("--apply", "-a", default=None, help="apply this patch file to the database")
+    parser.add_argument("--trial-run", "-t", action="store_true", default=False)
+    parser.add_argument("old_file", nargs='?', default=None)
+    parser.add_argument("new_file", nargs='?', default=Database_filename)
+
+    args = parser.parse_args()
+
+    if args.apply is not None:
+        load_database()
+        errors = apply_patch(args.apply)
+        if errors:
+            print(f"{errors} foreign key errors -- database not saved")
+        elif not args.trial_run:
+            print("Saving Database")
+            save_database()
+        else:
+            print("Trial_run: Database not saved")
+        return
+
+    assert args.old_file is not None, "db_diff: old_file required"
+    diffs = diff_databases(read_database(args.old_file), read_database(args.new_file))
+    if not diffs:
+        print("No differences")
+    for diff in diffs:
+        diff.print()
+    if args.patch is not None:
+        with open(args.patch, 'w') as f:
+            write_patch(diffs, f)
+
+
+
+if __name__ == "__main__":
+    run()
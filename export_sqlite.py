@@ -0,0 +1,166 @@
+# export_sqlite.py
+
+r'''Exports the database tables, including their calculated columns, into a SQLite file.
+
+This is for ad-hoc SQL queries (see sql_query.py).  The beans.csv file is still the master copy;
+the SQLite file can be deleted at any time and will be rebuilt on the next export.
+
+Each table's exported rows are hashed and the hash is stored in the "_exports" table of the SQLite
+file.  A re-export only rewrites the tables whose hash has changed.
+'''
+
+from itertools import chain
+import hashlib
+import sqlite3
+
+from database import *
+from row import parse_date, parse_bool, parse_set
+
+
+SQLite_filename = "beans.sqlite"
+
+Sql_types = {
+    str: "TEXT",
+    int: "INTEGER",
+    float: "REAL",
+    Decimal: "DECIMAL",      # NUMERIC affinity, so sums work in SQL
+    date: "DATE",
+    parse_date: "DATE",
+    parse_bool: "BOOLEAN",
+    parse_set: "TEXT",
+}
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(set, lambda s: ','.join(sorted(s)))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()))
+sqlite3.register_converter("DECIMAL", lambda b: Decimal(b.decode()))
+sqlite3.register_converter("BOOLEAN", lambda b: bool(int(b)))
+
+
+def connect(sqlite_filename=SQLite_filename):
+    r'''Returns a sqlite3 connection that converts DATE, DECIMAL and BOOLEAN columns back to python.
+    '''
+    return sqlite3.connect(sqlite_filename, detect_types=sqlite3.PARSE_DECLTYPES)
+
+def quote(name):
+    return f'"{name}"'
+
+def columns(row_class):
+    r'''Returns ((name, sql_type), ...) for all stored and calculated columns of row_class.
+    '''
+    ans = {}
+    for name, type in chain(row_class.types.items(), row_class.calculated.items()):
+        if name not in ans:
+            ans[name] = Sql_types[type]
+    return tuple(ans.items())
+
+def key_columns(row_class):
+    if row_class.primary_key is not None:
+        return (row_class.primary_key,)
+    if row_class.primary_keys is not None:
+        return tuple(row_class.primary_keys)
+    return None
+
+def indexes(row_class):
+    r'''Returns ((unique, cols), ...) for the indexes to create on row_class's table.
+
+    These are the primary key, the date (for date ordered tables) and the foreign keys.  An index
+    is skipped if its columns are a prefix of an index already on the list.
+    '''
+    ans = []
+    def add(unique, cols):
+        for _, cols2 in ans:
+            if cols2[:len(cols)] == cols:
+                return
+        ans.append((unique, cols))
+    pk = key_columns(row_class)
+    if pk is not None:
+        add(True, pk)
+    if 'date' in row_class.types:
+        add(False, ('date',))
+    for table_name in row_class.foreign_keys:
+        cols = key_columns(Tables[table_name].row_class)
+        if all(col in row_class.types for col in cols):
+            add(False, cols)
+    return tuple(ans)
+
+def table_rows(table, cols):
+    r'''Returns a list of the rows in table as tuples of the values in cols.
+    '''
+    return [tuple(getattr(row, name) for name in cols) for row in table.values()]
+
+def digest(cols, rows):
+    h = hashlib.sha1(repr(cols).encode())
+    for row in rows:
+        h.update(repr(row).encode())
+    return h.hexdigest()
+
+def export_table(conn, table, cols, rows):
+    name = quote(table.name)
+    conn.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.execute(f"CREATE TABLE {name} ({', '.join(f'{quote(col)} {type}' for col, type in cols)})")
+    conn.executemany(f"INSERT INTO {name} VALUES ({', '.join('?' * len(cols))})", rows)
+    for unique, index_cols in indexes(table.row_class):
+        index_name = quote(f"{table.name}_{'_'.join(index_cols)}")
+        conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index_name} "
+                     f"ON {name} ({', '.join(quote(col) for col in index_cols)})")
+
+def export_database(sqlite_filename=SQLite_filename, force=False, verbose=False):
+    r'''Exports all database tables into sqlite_filename.
+
+    Only tables that have changed since the last export are rewritten, unless force is True.
+
+    Returns a list of the names of the tables exported.
+    '''
+    exported = []
+    conn = connect(sqlite_filename)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS _exports "
+                         "(table_name TEXT PRIMARY KEY, digest TEXT, num_rows INTEGER)")
+            old_digests = dict(conn.execute("SELECT table_name, digest FROM _exports"))
+            for table in Tables.values():
+                if not table.row_class.in_database:
+                    continue
+                cols = columns(table.row_class)
+                col_names = tuple(name for name, _ in cols)
+                rows = table_rows(table, col_names)
+                new_digest = digest(cols, rows)
+                if not force and old_digests.get(table.name) == new_digest:
+                    if verbose:
+                        print("export_database: unchanged", table.name)
+                    continue
+                if verbose:
+                    print(f"export_database: exporting {table.name}, {len(rows)} rows")
+                export_table(conn, table, cols, rows)
+                conn.execute("INSERT OR REPLACE INTO _exports VALUES (?, ?, ?)",
+                             (table.name, new_digest, len(rows)))
+                exported.append(table.name)
+    finally:
+        conn.close()
+    return exported
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", "-f", action="store_true", default=False, help="re-export all tables")
+    parser.add_argument("--verbose", "-v", action="store_true", default=False)
+    parser.add_argument("sqlite_file", nargs='?', default=SQLite_filename)
+
+    args = parser.parse_args()
+
+    load_database()
+
+    exported = export_database(args.sqlite_file, force=args.force, verbose=args.verbose)
+    if exported:
+        print("Exported", ', '.join(exported), "to", args.sqlite_file)
+    else:
+        print("No changes to export")
+
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,171 @@
+# infer.py
+
+r'''Loads any pipe delimited csv file as a table, inferring the column types from the data.
+
+This lets ad-hoc files (e.g., raffle or attendance logs) be dumped and queried by report.py without
+writing a row class first:
+
+    python report.py Raffle-log.csv -w "tickets>10" -o=-tickets
+    python infer.py Raffle-log.csv        # shows the inferred column types
+
+The file may start with a table name line (like the side files, see read_side_file in table.py);
+otherwise the table is named after the file.  Then comes the header line and the rows.
+
+The types are inferred from the first Sample_size rows, by matching each value against the regexes in
+row.Value_types (int, date, Decimal, float, else str).  A column with ints and Decimals is Decimal, and
+other mixes of numbers are float.  Then the whole file is converted one column at a time.  A column with
+a value later in the file that doesn't match its type is inferred again from all of its values.
+'''
+
+from decimal import Decimal
+from datetime import date
+import csv
+import os.path
+
+from row import row, Converters, value_type
+from table import table_by_date, CSV_dialect, CSV_format
+
+
+Sample_size = 200
+
+Numeric = (int, Decimal, float)
+
+Members = {Decimal: (int, Decimal), float: Numeric}   # the types that merge_types folds into each type
+
+
+def merge_types(a, b):
+    r'''Returns the type that holds values of both type a and b.  Either may be None (only empty values).
+    '''
+    if a is None:
+        return b
+    if b is None or a is b:
+        return a
+    if a in Numeric and b in Numeric:
+        if int in (a, b) and Decimal in (a, b):
+            return Decimal
+        return float
+    return str
+
+def infer_type(values):
+    r'''Returns the type for the (stripped) string values, or None if they are all empty.
+    '''
+    ans = None
+    for type in set(map(value_type, values)):
+        ans = merge_types(ans, type)
+    return ans
+
+def convert_column(values, type):
+    r'''Returns the values converted to type (empty values are None).
+
+    Returns None if any of the values don't match type, or one of its Members (e.g., "3" for Decimal).
+    '''
+    converter = Converters[type]
+    accepted = Members.get(type, (type,))
+    ans = []
+    try:
+        for s in values:
+            if not s:
+                ans.append(None)
+            elif type is str or value_type(s) in accepted:
+                ans.append(converter(s))
+            else:
+                return None
+    except ValueError:           # e.g., Feb 30, 25
+        return None
+    return ans
+
+def read_csv(csv_filename):
+    r'''Returns table_name, header, rows with all of the values stripped.
+    '''
+    with open(csv_filename, 'r') as f:
+        csv_reader = csv.reader(f, CSV_dialect, **CSV_format)
+        first = next(csv_reader)
+        if len(first) == 1:
+            table_name = first[0].strip()
+            header = next(csv_reader)
+        else:
+            table_name = os.path.splitext(os.path.basename(csv_filename))[0]
+            header = first
+        header = [name.strip().lower().replace(' ', '_') for name in header]
+        assert len(set(header)) == len(header), f"{csv_filename}: duplicate column names in {header}"
+        rows = []
+        for row in csv_reader:
+            if len(row) == 0:
+                break
+            if len(row) != len(header):
+                raise ValueError(f"{csv_filename}, line {csv_reader.line_num}: {len(row)} columns, "
+                                 f"expected {len(header)}")
+            rows.append([value.strip() for value in row])
+    return table_name, header, rows
+
+def infer_columns(rows, num_columns, sample_size=None):
+    r'''Returns [(type, values)], one per column, with the values converted to type.
+
+    Columns with only empty values are str.
+    '''
+    if sample_size is None:
+        sample_size = Sample_size
+    ans = []
+    for i in range(num_columns):
+        raw = [row[i] for row in rows]
+        type = infer_type(raw[:sample_size]) or str
+        values = convert_column(raw, type)
+        if values is None:
+            type = infer_type(raw)
+            values = convert_column(raw, type)
+            if values is None:
+                type = str
+                values = convert_column(raw, type)
+        ans.append((type, values))
+    return ans
+
+def row_class_for(table_name, header, types):
+    r'''Returns a new row class (see row.py) for table_name with the columns in header of types.
+    '''
+    for name in header:
+        assert not hasattr(row, name), f"{table_name}: column name {name!r} is reserved"
+    attrs = dict(types={name: Converters[type] for name, type in zip(header, types)},
+                 required=frozenset(),
+                 calculated={},
+                 in_database=False)
+    attrs.update((name, None) for name in header)
+    return type(table_name, (row,), attrs)
+
+def load_inferred(csv_filename, sample_size=None):
+    r'''Returns a table_by_date (see table.py) with the rows in csv_filename.
+
+    The rows are sorted by date if there is a date column with a date in every row.
+    '''
+    table_name, header, rows = read_csv(csv_filename)
+    columns = infer_columns(rows, len(header), sample_size)
+    row_class = row_class_for(table_name, header, [type for type, _ in columns])
+    table = table_by_date(row_class)
+    if table.dated:
+        date_type, dates = columns[header.index('date')]
+        table.dated = date_type is date and None not in dates
+    from_typed = row_class.from_typed
+    table.insert_many([from_typed({name: value for name, value in zip(header, values) if value is not None})
+                       for values in zip(*(values for _, values in columns))])
+    return table
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", "-s", type=int, default=Sample_size, help="rows to infer types from")
+    parser.add_argument("csv_file")
+
+    args = parser.parse_args()
+
+    table_name, header, rows = read_csv(args.csv_file)
+    columns = infer_columns(rows, len(header), args.sample)
+    print(f"{table_name}: {len(rows)} rows")
+    width = max(map(len, header), default=0)
+    for name, (type, values) in zip(header, columns):
+        print(f"  {name:{width}} {type.__name__:8} {values.count(None)} empty")
+
+
+
+if __name__ == "__main__":
+    run()
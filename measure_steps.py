@@ -0,0 +1,89 @@
+# measure_steps.py
+
+r'''Reports the peak RSS and wall time of each of the STEPS commands.
+
+The commands are run against a copy of the .csv files in a temporary directory, so the real
+database is never changed.  Commands that would prompt for input get an empty stdin.
+
+    python measure_steps.py                  # all of the STEPS commands
+    python measure_steps.py cash_balance.py  # just this one (with its default args below)
+    python measure_steps.py "report.py Items"
+
+Set BEANS_LOW_RESOURCE=1 (and optionally BEANS_MAX_MEMORY_MB) to measure the low-resource mode.
+'''
+
+from pathlib import Path
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# (script, args...) in STEPS order.  These all use --trial-run where available.
+Steps = (
+    ("update_reconcile.py", "-t"),
+    ("cash_balance.py", "-t"),
+    ("cash_swap.py", "-t"),
+    ("treasurer_report.py",),
+    ("new_month.py", "-t"),
+    ("create_inv_checklist.py",),
+    ("read_inv.py", "-t"),
+    ("create_orders.py",),
+    ("create_POs.py",),
+    ("record_purchases.py", "-t"),
+    ("calc_consumed.py", "-t"),
+    ("calc_estimates.py", "-t"),
+    ("report.py", "Inventory"),
+)
+
+Source_dir = Path(__file__).resolve().parent
+
+
+def measure(command, work_dir, verbose=False):
+    r'''Runs command (script, args...) in work_dir.
+
+    Returns exit status, peak RSS in MB, wall time in seconds.
+    '''
+    args = [sys.executable, str(Source_dir / command[0])] + list(command[1:])
+    output = None if verbose else subprocess.DEVNULL
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=work_dir, stdin=subprocess.DEVNULL, stdout=output, stderr=output)
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    return os.waitstatus_to_exitcode(status), rusage.ru_maxrss / 1024, wall_time   # ru_maxrss is in KB on Linux
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--verbose", "-v", action="store_true", default=False, help="show command output")
+    parser.add_argument("commands", nargs='*', help='e.g., "report.py Items", default all STEPS commands')
+
+    args = parser.parse_args()
+
+    if args.commands:
+        defaults = {step[0]: step for step in Steps}
+        commands = []
+        for command in args.commands:
+            command = tuple(command.split())
+            if len(command) == 1 and command[0] in defaults:
+                command = defaults[command[0]]
+            commands.append(command)
+    else:
+        commands = Steps
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for csv_file in Path.cwd().glob("*.csv"):
+            shutil.copy(csv_file, work_dir)
+        print("command                       |status|peak RSS MB|wall secs")
+        for command in commands:
+            status, peak_rss, wall_time = measure(command, work_dir, args.verbose)
+            print(f"{' '.join(command):30}|{status:6}|{peak_rss:11.1f}|{wall_time:9.3f}")
+
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,310 @@
+# merge.py
+
+r'''Three-way row level merge of database files, e.g., beans.csv edited on two machines.
+
+    python merge.py base.csv ours.csv theirs.csv          # writes the merge over ours.csv
+    python merge.py base.csv ours.csv theirs.csv -o merged.csv
+    python merge.py base.csv ours.csv theirs.csv --favor theirs --trial-run
+
+The rows are matched the same way as db_diff.py: by the table's primary key, or for tables without one
+(e.g., Reconcile), by date and position within the date.  The values are compared after stripping, so
+re-padding a column on one side doesn't conflict with anything.
+
+A row changed on only one side takes that side's row.  A row changed on both sides is merged value by
+value; only a value changed to two different things (or a row deleted on one side and changed on the
+other) is a conflict.  Conflicts are printed, and take the --favor side's value (default ours), so the
+result still loads.
+
+Rows added on both sides at the same place (e.g., Reconcile rows for the same date) are all kept, ours
+first, without reordering either side.  If both sides added rows that the other didn't, this is also
+reported as a conflict, since the tables without a primary key are ordered ledgers (e.g., the
+"cash|w/starts" row must be last for its date), so the order needs checking.
+
+Unchanged tables, and unchanged dates within a table, are compared as tuples of strings, so the merge is
+linear in the size of the files.
+
+The exit status is 1 if there are conflicts, so this works as a git merge driver:
+
+    git config merge.beans.name "beans.csv row level merge"
+    git config merge.beans.driver "python merge.py %O %A %B"
+
+along with "beans.csv merge=beans" in .gitattributes.
+'''
+
+from collections import Counter
+from difflib import SequenceMatcher
+from datetime import date
+import os
+
+from table import load_database, write_tables, foreign_key_errors, get_database
+from row import parse_date
+from db_diff import Raw_table, read_database, primary_key_columns, group_by_date
+
+
+class Merge:
+    r'''Merges rows (tuples of stripped strings in `columns` order), collecting the conflicts.
+    '''
+    def __init__(self, favor="ours", theirs_first=False):
+        assert favor in ("ours", "theirs"), f"Merge: favor must be 'ours' or 'theirs', got {favor=}"
+        self.favor = favor
+        self.theirs_first = theirs_first     # order of the rows added on both sides at the same place
+        self.conflicts = []   # [str]
+
+    def pick(self, ours, theirs):
+        return ours if self.favor == "ours" else theirs
+
+    def row(self, columns, base, ours, theirs, where):
+        r'''Returns the merged row, or None if it is deleted.  Any of base, ours, theirs may be None.
+        '''
+        if ours == theirs or base == theirs:
+            return ours
+        if base == ours:
+            return theirs
+        if ours is None or theirs is None:
+            self.conflicts.append(f"{where}: deleted in {'ours' if ours is None else 'theirs'}, "
+                                  f"changed in {'theirs' if ours is None else 'ours'}")
+            return self.pick(ours, theirs)
+        if base is None:
+            base = ('',) * len(columns)
+        ans = []
+        for col, b, o, t in zip(columns, base, ours, theirs):
+            if o == t or t == b:
+                ans.append(o)
+            elif o == b:
+                ans.append(t)
+            else:
+                self.conflicts.append(f"{where}.{col}: base={b!r}, ours={o!r}, theirs={t!r}")
+                ans.append(self.pick(o, t))
+        return tuple(ans)
+
+    def by_key(self, name, columns, key_cols, base, ours, theirs):
+        r'''Returns the merged rows, in ours order followed by the rows only in theirs.
+        '''
+        key_indexes = [columns.index(col) for col in key_cols]
+        def key_map(rows):
+            return {tuple(row[i] for i in key_indexes): row for row in rows}
+        base_map, ours_map, theirs_map = key_map(base), key_map(ours), key_map(theirs)
+        keys = list(ours_map.keys()) + [key for key in theirs_map.keys() if key not in ours_map] \
+             + [key for key in base_map.keys() if key not in ours_map and key not in theirs_map]
+        ans = []
+        for key in keys:
+            row = self.row(columns, base_map.get(key), ours_map.get(key), theirs_map.get(key),
+                           f"{name}[{', '.join(key)}]")
+            if row is not None:
+                ans.append(row)
+        return ans
+
+    def by_position(self, name, columns, base, ours, theirs):
+        r'''Returns the merged rows, merging the rows for each date as sequences.
+        '''
+        base_groups = group_by_date(columns, base)
+        ours_groups = group_by_date(columns, ours)
+        theirs_groups = group_by_date(columns, theirs)
+        dates = set(base_groups) | set(ours_groups) | set(theirs_groups)
+        ans = []
+        for day in sorted(dates, key=lambda day: parse_date(day) if day else date.min):
+            ans.extend(self.sequence(columns, base_groups.get(day, []), ours_groups.get(day, []),
+                                     theirs_groups.get(day, []), f"{name}[{day}"))
+        return ans
+
+    def sequence(self, columns, base, ours, theirs, where):
+        r'''Returns the merge of the lists of rows (a diff3 of the rows for one date).
+
+        Each side is diffed against base separately (see regions).  A change on only one side is taken
+        as is, and the base rows that neither side changes are kept.  Where the changes on both sides
+        overlap, the rows are merged by chunk.
+        '''
+        if ours == theirs or base == theirs:
+            return ours
+        if base == ours:
+            return theirs
+        ans = []
+        i = 0
+        for start, end, ours_rows, theirs_rows in regions(base, ours, theirs):
+            ans.extend(base[i:start])
+            ans.extend(self.chunk(columns, base[start:end], ours_rows, theirs_rows, where, start))
+            i = end
+        ans.extend(base[i:])
+        return ans
+
+    def chunk(self, columns, base, ours, theirs, where, start):
+        if ours == theirs or base == theirs:
+            return ours
+        if base == ours:
+            return theirs
+        if not base:
+            # added on both sides: the first side's rows, then the other side's rows that aren't in them
+            first, second = (theirs, ours) if self.theirs_first else (ours, theirs)
+            extra = Counter(second)
+            extra.subtract(first)
+            ans = list(first)
+            for row in second:
+                if extra[row] > 0:
+                    extra[row] -= 1
+                    ans.append(row)
+            if len(ans) > len(first) and len(ans) > len(second):
+                self.conflicts.append(f"{where}, @{start}]: rows added in both ours and theirs, kept "
+                                      f"{'theirs' if self.theirs_first else 'ours'} first, check the order")
+            return ans
+        if len(base) == len(ours) == len(theirs):
+            return [self.row(columns, b, o, t, f"{where}, @{start + n}]")
+                    for n, (b, o, t) in enumerate(zip(base, ours, theirs))]
+        self.conflicts.append(f"{where}, @{start}]: {len(base)} rows changed to {len(ours)} rows in ours "
+                              f"and {len(theirs)} rows in theirs")
+        return self.pick(ours, theirs)
+
+    def table(self, name, base, ours, theirs):
+        r'''Returns the merged Raw_table (any of base, ours, theirs may be None), or None if it is deleted.
+        '''
+        present = [table for table in (base, ours, theirs) if table is not None]
+        columns = present[0].header
+        for table in present[1:]:
+            columns += tuple(col for col in table.header if col not in columns)
+        rows = [table.normalize(columns) if table is not None else None for table in (base, ours, theirs)]
+        if ours is None or theirs is None:
+            other = ours if ours is not None else theirs
+            if other is None or base is None:
+                # deleted on both sides, or added on one side
+                return other
+            if rows[0] == other.normalize(columns):
+                # deleted on one side, unchanged on the other
+                return None
+            self.conflicts.append(f"{name}: table deleted in {'ours' if ours is None else 'theirs'}, "
+                                  f"changed in {'theirs' if ours is None else 'ours'}")
+            return other
+        base_rows, ours_rows, theirs_rows = (r if r is not None else [] for r in rows)
+        if ours_rows == theirs_rows or base_rows == theirs_rows:
+            merged = ours_rows
+        elif base_rows == ours_rows:
+            merged = theirs_rows
+        else:
+            key_cols = primary_key_columns(name)
+            if key_cols is not None and all(col in columns for col in key_cols):
+                merged = self.by_key(name, columns, key_cols, base_rows, ours_rows, theirs_rows)
+            else:
+                merged = self.by_position(name, columns, base_rows, ours_rows, theirs_rows)
+        return Raw_table(name, columns, merged)
+
+    def databases(self, base, ours, theirs):
+        r'''Returns {table_name: Raw_table} merging the {table_name: Raw_table} (see db_diff.read_database).
+        '''
+        ans = {}
+        names = list(ours.keys()) + [name for name in theirs.keys() if name not in ours] \
+              + [name for name in base.keys() if name not in ours and name not in theirs]
+        for name in names:
+            table = self.table(name, base.get(name), ours.get(name), theirs.get(name))
+            if table is not None:
+                ans[name] = table
+        return ans
+
+def changes(base, side):
+    r'''Returns [(start, end, rows)] where side replaces base[start:end] with rows, in base order.
+    '''
+    return [(i1, i2, side[j1:j2])
+            for tag, i1, i2, j1, j2 in SequenceMatcher(None, base, side, autojunk=False).get_opcodes()
+            if tag != 'equal']
+
+def regions(base, ours, theirs):
+    r'''Returns [(start, end, ours_rows, theirs_rows)] for the parts of base changed by either side, in
+    order.
+
+    Changes on the two sides that overlap in base (or add rows at the same place) share a region.  A
+    side that doesn't change a region has base[start:end] as its rows.
+    '''
+    hunks = sorted([(start, end, rows, 0) for start, end, rows in changes(base, ours)] +
+                   [(start, end, rows, 1) for start, end, rows in changes(base, theirs)],
+                   key=lambda hunk: hunk[:2])
+    groups = []   # [[start, end, [hunk, ...]]]
+    for hunk in hunks:
+        start, end = hunk[:2]
+        if groups:
+            group = groups[-1]
+            if start < group[1] or start == end == group[0] == group[1]:
+                group[1] = max(group[1], end)
+                group[2].append(hunk)
+                continue
+        groups.append([start, end, [hunk]])
+    ans = []
+    for start, end, group in groups:
+        sides = []
+        for side in (0, 1):
+            rows = []
+            i = start
+            for hunk_start, hunk_end, hunk_rows, hunk_side in group:
+                if hunk_side == side:
+                    rows.extend(base[i:hunk_start])
+                    rows.extend(hunk_rows)
+                    i = hunk_end
+            rows.extend(base[i:end])
+            sides.append(rows)
+        ans.append((start, end, sides[0], sides[1]))
+    return ans
+
+def write_raw(tables, file):
+    r'''Writes the Raw_tables {table_name: Raw_table} in database format, without padding.
+    '''
+    for table in tables.values():
+        print(table.name, file=file)
+        print('|'.join(table.header), file=file)
+        for row in table.rows:
+            print('|'.join(row), file=file)
+        print(file=file)
+
+def merge_files(base_file, ours_file, theirs_file, output_file, favor="ours", trial_run=False,
+                theirs_first=False):
+    r'''Merges the database files into output_file.  Returns the list of conflicts.
+
+    Rows added on both sides at the same place are kept in ours' order followed by theirs' other rows,
+    or the other way around if theirs_first.
+
+    The merged tables are loaded and written by save_database's write_tables, so the result is padded
+    the same way as beans.csv.  Foreign key errors in the result are reported as conflicts.
+    '''
+    merge = Merge(favor, theirs_first)
+    tables = merge.databases(read_database(base_file), read_database(ours_file), read_database(theirs_file))
+    temp_filename = output_file + '-merge.csv'
+    with open(temp_filename, 'w') as f:
+        write_raw(tables, f)
+    try:
+        load_database(temp_filename, skip_fk_check=True)
+    finally:
+        os.remove(temp_filename)
+    merge.conflicts.extend(foreign_key_errors(get_database()))
+    if not trial_run:
+        with open(temp_filename, 'w') as f:
+            write_tables(f)
+        os.replace(temp_filename, output_file)
+    return merge.conflicts
+
+
+def run():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", "-o", default=None, help="merged file (default ours_file)")
+    parser.add_argument("--favor", "-f", choices=("ours", "theirs"), default="ours",
+                        help="side taken for conflicting values")
+    parser.add_argument("--trial-run", "-t", action="store_true", default=False)
+    parser.add_argument("base_file")
+    parser.add_argument("ours_file")
+    parser.add_argument("theirs_file")
+
+    args = parser.parse_args()
+
+    output = args.output if args.output is not None else args.ours_file
+    conflicts = merge_files(args.base_file, args.ours_file, args.theirs_file, output, args.favor,
+                            args.trial_run)
+    for conflict in conflicts:
+        print(conflict)
+    if args.trial_run:
+        print("Trial_run: merge not saved")
+    if conflicts:
+        print(f"Total conflicts: {len(conflicts)}, took {args.favor}")
+        sys.exit(1)
+    print("Merged without conflicts")
+
+
+
+if __name__ == "__main__":
+    run()
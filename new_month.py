@@ -21,7 +21,7 @@ def run():
     new_month = args.new_month
     end_day = args.end_day
 
-    load_database()
+    load_database(tables=("Months",))
 
     last_month = list(Months.values())[-1]
     print(f"last_month: {last_month.month_str}, ", end='')
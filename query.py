@@ -0,0 +1,280 @@
+# query.py
+
+r'''A small query layer over the database tables.
+
+    Query("Inventory").where(item="Bacon", code="purchased").dates("Jan 01, 25", "Dec 31, 25") \
+                      .group_by("item").sum("num_pkgs", "total_units")
+
+    Query("Reconcile").where("total>100", type="Expenses").select("date", "account", "total") \
+                      .order_by("-total")
+
+Queries are built up by chaining where, dates, select, group_by, sum, count and order_by, and then
+iterated to get tuples of the selected (or grouped and summed) columns, in the order given by headers.
+Columns may be stored or calculated columns.
+
+Equality conditions on stored columns use an existing index on the table (see base_table.create_index),
+and date ranges on date ordered tables (like Reconcile) only visit the rows in the range.  Results are
+streamed, except that group_by and order_by need to see all of the matching rows first.
+
+report.py exposes this on the command line (see its --where, --columns, --order-by, etc).
+'''
+
+from bisect import bisect_left, bisect_right
+from datetime import date
+from operator import attrgetter, eq, ne, lt, le, gt, ge
+import re
+
+from row import parse_date, parse_bool
+from table import get_database, table_by_date
+
+
+Operators = {'=': eq, '!=': ne, '<': lt, '<=': le, '>': gt, '>=': ge}
+
+Parsers = {date: parse_date, bool: parse_bool}   # for calculated column types that can't parse strings
+
+Condition_re = re.compile(r'\s*(\w+)\s*(!=|<=|>=|=|<|>)\s*(.*)$')
+
+
+def parse_condition(text):
+    r'''Parses "name<op>value", e.g., "item=Bacon" or "total>=100".  Returns name, op, value.
+    '''
+    match = Condition_re.match(text)
+    assert match, f"parse_condition: expected name<op>value (with op one of {' '.join(Operators)}), got {text!r}"
+    return match.group(1).lower(), match.group(2), match.group(3).strip()
+
+def sort_key(value):
+    r'''Sorts None first.
+    '''
+    return value is not None, value
+
+def strip_descending(column):
+    r'''Returns the column name without its '-' or '~' (descending) prefix, see Query.order_by.
+    '''
+    return column[1:] if column[:1] in ('-', '~') else column
+
+
+class Query:
+    def __init__(self, table, database=None):
+        if database is None:
+            database = get_database()
+        if isinstance(table, str):
+            table = getattr(database, table)
+        self.table = table
+        self.row_class = table.row_class
+        self.equals = {}             # {name: value}
+        self.conditions = []         # [(name, op function, value)]
+        self.predicates = []         # [fn(row) -> bool]
+        self.start_date = None
+        self.end_date = None
+        self.columns = None
+        self.group_columns = None
+        self.sum_columns = ()
+        self.counting = False
+        self.sort_columns = ()
+
+    def column_type(self, name):
+        if name in self.row_class.types:
+            return self.row_class.types[name]
+        if name in self.row_class.calculated:
+            return self.row_class.calculated[name]
+        raise AssertionError(f"Query({self.table.name}): unknown column {name!r}")
+
+    def parser(self, name):
+        r'''Returns the function converting a string to column name's type.
+        '''
+        type = self.column_type(name)
+        return Parsers.get(type, type)
+
+    def where(self, *conditions, **equals):
+        r'''Only rows matching all of the conditions.
+
+        Each condition is a string, "name<op>value" (see parse_condition), or a function taking a row
+        and returning True or False.  Each keyword is name=value.
+        '''
+        for condition in conditions:
+            if callable(condition):
+                self.predicates.append(condition)
+            else:
+                name, op, value = parse_condition(condition)
+                value = self.parser(name)(value)
+                if op == '=':
+                    self.equals[name] = value
+                else:
+                    self.conditions.append((name, Operators[op], value))
+        for name, value in equals.items():
+            self.column_type(name)
+            self.equals[name] = value
+        return self
+
+    def dates(self, start=None, end=None):
+        r'''Only rows with start <= date <= end.  Either may be None.
+        '''
+        self.column_type('date')
+        if start is not None:
+            self.start_date = parse_date(start)
+        if end is not None:
+            self.end_date = parse_date(end)
+        return self
+
+    def select(self, *columns):
+        for name in columns:
+            self.column_type(name)
+        self.columns = columns
+        return self
+
+    def group_by(self, *columns):
+        for name in columns:
+            self.column_type(name)
+        self.group_columns = columns
+        return self
+
+    def sum(self, *columns):
+        for name in columns:
+            self.column_type(name)
+        self.sum_columns = columns
+        return self
+
+    def count(self):
+        self.counting = True
+        return self
+
+    def order_by(self, *columns):
+        r'''Sorts by these columns.  Prefix a column with '-' (or '~', which is easier on the command line)
+        to sort it in descending order.
+
+        With group_by, sum or count, these must be result columns (see headers), e.g., "count".
+        '''
+        for name in map(strip_descending, columns):
+            if name != "count":
+                self.column_type(name)
+        self.sort_columns = columns
+        return self
+
+    def check_sort_columns(self):
+        for name in map(strip_descending, self.sort_columns):
+            if not self.aggregate:
+                self.column_type(name)
+            elif name not in self.headers:
+                raise AssertionError(f"Query({self.table.name}): can't order by {name!r}, "
+                                     f"it isn't one of the result columns {self.headers}")
+
+    @property
+    def aggregate(self):
+        return self.group_columns is not None or self.sum_columns or self.counting
+
+    @property
+    def headers(self):
+        if self.aggregate:
+            return tuple(self.group_columns or ()) + tuple(self.sum_columns) + (("count",) if self.counting else ())
+        if self.columns is not None:
+            return tuple(self.columns)
+        return tuple(name
+                     for name in tuple(self.row_class.types.keys()) + tuple(self.row_class.calculated.keys())
+                     if name not in self.row_class.hidden)
+
+    def header_type(self, name):
+        if name == "count" and self.counting:
+            return int
+        return self.column_type(name)
+
+    def find_index(self):
+        r'''Returns the existing index covering the most of the equals on stored columns, or None.
+        '''
+        best = None
+        for index in self.table.indexes.values():
+            if all(name in self.equals and name in self.row_class.types for name in index.attrs):
+                if best is None or len(index.attrs) > len(best.attrs):
+                    best = index
+        return best
+
+    def rows(self):
+        r'''Generates the matching rows, in table order.
+        '''
+        table = self.table
+        dated = isinstance(table, table_by_date) and table.dated
+        start, end = self.start_date, self.end_date
+        check_dates = start is not None or end is not None
+        equals = dict(self.equals)
+        index = self.find_index()
+        if index is not None:
+            key = tuple(equals.pop(name) for name in index.attrs)
+            rows = index.lookup(key if len(key) > 1 else key[0])
+            if check_dates and dated:
+                # the rows in an index on a table_by_date are in date order
+                first = 0 if start is None else bisect_left(rows, start, key=attrgetter('date'))
+                last = len(rows) if end is None else bisect_right(rows, end, key=attrgetter('date'))
+                rows = rows[first:last]
+                check_dates = False
+        elif check_dates and dated:
+            first = 0 if start is None else table.first_date(start)
+            last = len(table) if end is None else table.last_date(end)
+            rows = table.irange(first, last)
+            check_dates = False
+        else:
+            rows = table.values()
+        equals = tuple(equals.items())
+        for row in rows:
+            if check_dates:
+                if start is not None and row.date < start:
+                    continue
+                if end is not None and row.date > end:
+                    continue
+            if any(getattr(row, name) != value for name, value in equals):
+                continue
+            if not all(self.test(row, name, op, value) for name, op, value in self.conditions):
+                continue
+            if not all(predicate(row) for predicate in self.predicates):
+                continue
+            yield row
+
+    @staticmethod
+    def test(row, name, op, value):
+        row_value = getattr(row, name)
+        if row_value is None:
+            return op is ne
+        return op(row_value, value)
+
+    def __iter__(self):
+        r'''Generates a tuple for each result row, with values in the order of headers.
+        '''
+        self.check_sort_columns()
+        if self.aggregate:
+            results = self.aggregate_rows()
+            headers = self.headers
+            self.sort(results, lambda result, name: result[headers.index(name)])
+            return iter(results)
+        rows = self.rows()
+        if self.sort_columns:
+            rows = list(rows)
+            self.sort(rows, getattr)
+        get_values = attrgetter(*self.headers)
+        if len(self.headers) == 1:
+            return ((get_values(row),) for row in rows)
+        return map(get_values, rows)
+
+    def sort(self, results, get):
+        r'''Sorts results in place.  get(result, name) returns the value of column name.
+        '''
+        for column in reversed(self.sort_columns):
+            name = strip_descending(column)
+            descending = name != column
+            results.sort(key=lambda result: sort_key(get(result, name)), reverse=descending)
+
+    def aggregate_rows(self):
+        r'''Returns a list of (group values..., sums..., [count]), in the order the groups are first seen.
+        '''
+        group_columns = self.group_columns or ()
+        groups = {}      # {group values: [sums..., count]}
+        for row in self.rows():
+            key = tuple(getattr(row, name) for name in group_columns)
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = [0] * len(self.sum_columns) + [0]
+            for i, name in enumerate(self.sum_columns):
+                value = getattr(row, name)
+                if value is not None:
+                    totals[i] += value
+            totals[-1] += 1
+        if not groups and not group_columns:
+            groups[()] = [0] * len(self.sum_columns) + [0]
+        return [key + tuple(totals if self.counting else totals[:-1]) for key, totals in groups.items()]
@@ -1,7 +1,7 @@
 # record_purchases.py
 
 r'''
-  - add "purchased" rows to Inventory table
+  - add "purchased" rows to Inventory table, skipping orders already recorded for that month (see Imports)
   - update location and price in Products
   # write receipt slips (computer figures out bills?)
   #   -- don't have price paid, might go to two different people...
@@ -19,6 +19,8 @@ def run():
     parser = argparse.ArgumentParser()
     parser.add_argument("--trial-run", "-t", action="store_true", default=False)
     parser.add_argument("--no-clear", "-n", action="store_true", default=False)
+    parser.add_argument("--force", "-f", action="store_true", default=False,
+                        help="also record orders that were already recorded")
     parser.add_argument("--month", "-m", type=int, default=today.month)
     parser.add_argument("--day", "-d", type=int, default=today.day)
     parser.add_argument("--year", "-y", type=int, default=today.year)
@@ -26,8 +28,7 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
-    load_csv(args.orders_csv_file)
+    load_database(tables=("Months", "Items", "Products", "Inventory", "Orders", "Imports"))
 
     year = args.year
     month = args.month
@@ -41,6 +42,10 @@ def run():
     eff_date = date(year, month, day)
     print(f"Effective date {eff_date:%b %d, %y}")
 
+    load_side_file(args.orders_csv_file, Orders, from_scratch=True, once=not args.force,
+                   salt=f"{eff_date:%Y-%m}")
+
+    purchases = []
     for order in Orders.values():
         assert order.item in Items, f"{order.item=} not in Items table"
         attrs = dict(date=eff_date, item=order.item, code="purchased")
@@ -50,7 +55,7 @@ def run():
             attrs["num_pkgs"] = order.qty
         if order.purchased_units is not None:
             attrs["num_units"] = order.purchased_units
-        Inventory.insert(**attrs)
+        purchases.append(Inventory.row_class(**attrs))
         if order.location is not None:
             print(f"Updating Product[{order.product.item}, {order.product.supplier}, "
                                    f"{order.product.supplier_id}].location to", order.location)
@@ -59,6 +64,7 @@ def run():
             print(f"Updating Product[{order.product.item}, {order.product.supplier}, "
                                    f"{order.product.supplier_id}].price to", order.price)
             order.product.price = order.price
+    Inventory.insert_many(purchases)
 
     if not args.trial_run:
         print("Saving Database")
@@ -73,46 +73,65 @@ Steps:
 from pathlib import Path
 import sys
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import landscape as Landscape, portrait as Portrait, letter, inch
-
 
 __all__ = "set_canvas get_pagesize set_landscape canvas_showPage canvas_save Report " \
           "Left Centered Right Value Row_template dump_table".split()
 
 
+# reportlab is only imported when a pdf is actually drawn, so that text reports start fast and stay small.
+# This is reportlab.lib.pagesizes.letter (8.5" x 11" in points), portrait and landscape.
+Letter_portrait = (612.0, 792.0)
+Letter_landscape = (792.0, 612.0)
+
 Canvas = None
+Canvas_path = None
 Pagesize = None
 Page_width = None
 Page_height = None
 
 def set_canvas(filename, path=Path("~/storage/downloads/"), landscape=False):
-    global Canvas, Pagesize, Page_width, Page_height
+    r'''The ReportLab canvas isn't created until it is first needed (see get_canvas).
+    '''
+    global Canvas, Canvas_path, Pagesize, Page_width, Page_height
     if not filename.endswith(".pdf"):
         filename += ".pdf"
-    path = (path / filename).expanduser()
+    Canvas_path = str((path / filename).expanduser())
     if landscape:
-        Pagesize = Landscape(letter)
+        Pagesize = Letter_landscape
     else:
-        Pagesize = Portrait(letter)
+        Pagesize = Letter_portrait
     Page_width, Page_height = Pagesize
-    Canvas = canvas.Canvas(str(path), pagesize=Pagesize)
+    Canvas = None
+
+def get_canvas():
+    global Canvas
+    if Canvas is None:
+        from reportlab.pdfgen import canvas
+        Canvas = canvas.Canvas(Canvas_path, pagesize=Pagesize)
+    return Canvas
+
+def string_width(text, fontName, fontSize):
+    r'''In points.
+    '''
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    return stringWidth(text, fontName, fontSize)
 
 def get_pagesize():
     return Pagesize
 
 def set_landscape():
     global Pagesize, Page_width, Page_height
-    Pagesize = Landscape(letter)
+    Pagesize = Letter_landscape
     Page_width, Page_height = Pagesize
     print(f"set_landscape({Pagesize})")
-    Canvas.setPageSize(Pagesize)
+    if Canvas is not None:
+        Canvas.setPageSize(Pagesize)
 
 def canvas_showPage():
-    Canvas.showPage()
+    get_canvas().showPage()
 
 def canvas_save():
-    Canvas.save()
+    get_canvas().save()
 
 class Report:
     default_font = 'Helvetica'
@@ -160,8 +179,10 @@ class Report:
     def new_row(self, row_layout, *values, size=None, bold=None, pad=0):
         return self.row_layouts[row_layout].new_row(*values, size=size, bold=bold, pad=pad)
 
-    def init(self):
-        self.set_sizes()
+    def init(self, pdf=True):
+        r'''The widths in points are only needed for pdf output.
+        '''
+        self.set_sizes(pdf)
         self.set_y_starts()
         self.set_x_starts()
 
@@ -185,7 +206,7 @@ class Report:
             row.draw(x_offset, y_offset)
 
     def print_init(self, verbose=False):
-        self.init()
+        self.init(pdf=False)
         if verbose:
             print("Report width", self.report_width_chars(), "height", self.report_height_chars())
 
@@ -220,9 +241,9 @@ class Report:
         self.rows.append(row)
         return len(self.rows)
 
-    def set_sizes(self):
+    def set_sizes(self, pdf=True):
         for row in self.rows:
-            row.set_sizes()
+            row.set_sizes(pdf)
 
     def set_y_starts(self):
         BM(self)  # add dummy bottom margin row to capture the height of the report.
@@ -269,12 +290,8 @@ class Cell:
             self.fontName = self.col.report.default_font
         self.text_format = text_format or col.text_format
         self.text2_format = text2_format or col.text2_format
-        self.width1 = Canvas.stringWidth(self.format_text(self.text, self.text_format),
-                                         fontName=self.fontName,
-                                         fontSize=self.size)
         self.text2 = None
         self.bold2 = None
-        self.width2 = 0
 
     def format_text(self, text, text_format):
         if text is None:
@@ -294,13 +311,29 @@ class Cell:
             self.fontName2 = self.col.report.default_font
         if text2_format is not None:
             self.text2_format = text2_format
-        self.width1 += self.col.report.text2_gap_percent * self.size
-        self.width2 = Canvas.stringWidth(self.format_text(self.text2, self.text2_format),
-                                         fontName=self.fontName2,
-                                         fontSize=self.size)
 
-    def set_sizes(self):
-        self.col.set_width(self.my_width(), self.my_width_chars())
+    @property
+    def width1(self):
+        r'''In points, includes the gap before text2.
+        '''
+        ans = string_width(self.format_text(self.text, self.text_format), self.fontName, self.size)
+        if self.text2 is not None:
+            ans += self.col.report.text2_gap_percent * self.size
+        return ans
+
+    @property
+    def width2(self):
+        r'''In points.
+        '''
+        if self.text2 is None:
+            return 0
+        return string_width(self.format_text(self.text2, self.text2_format), self.fontName2, self.size)
+
+    def set_sizes(self, pdf=True):
+        if pdf:
+            self.col.set_width(self.my_width(), self.my_width_chars())
+        else:
+            self.col.set_width(0, self.my_width_chars())
         self.row.set_height(self.my_height(), 1)
 
     def my_height(self):
@@ -324,15 +357,16 @@ class Cell:
         return width1 + width2
 
     def draw(self, x_offset, y_offset):
-        Canvas.setFont(self.fontName, self.size)
+        canvas = get_canvas()
+        canvas.setFont(self.fontName, self.size)
         x = self.col.get_x_offset(self.my_width())
-        Canvas.drawString(x + x_offset,
+        canvas.drawString(x + x_offset,
                           Page_height - (y_offset + self.row.y_end),
                           self.format_text(self.text, self.text_format))
 
         if self.text2 is not None:
-            Canvas.setFont(self.fontName2, self.size)
-            Canvas.drawString(x + x_offset + self.width1,
+            canvas.setFont(self.fontName2, self.size)
+            canvas.drawString(x + x_offset + self.width1,
                               Page_height - (y_offset + self.row.y_end),
                               self.format_text(self.text2, self.text2_format))
 
@@ -470,7 +504,7 @@ class BM:
         if y_char > self.y_char_start:
             self.y_char_start = y_char
 
-    def set_sizes(self):
+    def set_sizes(self, pdf=True):
         pass
 
     def draw(self, x_offset, y_offset):
@@ -519,9 +553,9 @@ class Row(BM):
         '''
         self.cells[-1].set_text2(text, bold, text2_format)
 
-    def set_sizes(self):
+    def set_sizes(self, pdf=True):
         for cell in self.cells:
-            cell.set_sizes()
+            cell.set_sizes(pdf)
 
     def draw(self, x_offset, y_offset):
         for cell in self.cells:
@@ -660,30 +694,51 @@ class Row_template(Value):
                 child.insert(report)
 
 
-def dump_table(table_name, pdf=False, default_fontsize=13):
-    from itertools import chain
+def dump_table(table_name, pdf=False, default_fontsize=13, where=(), start_date=None, end_date=None,
+               columns=None, group_by=None, sums=(), count=False, order_by=()):
+    r'''Dumps the table, or the results of a query on it (see query.py), to stdout or a pdf.
+    '''
     import database
+    from query import Query
 
-    database.load_database()
+    if table_name.endswith('.csv') and table_name[:-4] not in database.Tables:
+        # ad-hoc file without a row class
+        from infer import load_inferred
 
-    if table_name.endswith('.csv'):
-        database.load_csv(table_name)  # replaces table in database with .csv file, but we don't save the database!
-        table_name = table_name[:-4]
-
-    table = getattr(database, table_name)
+        table = load_inferred(table_name)
+        table_name = table.name
+    else:
+        if table_name.endswith('.csv'):
+            database.load_database(tables=(table_name[:-4],))
+            database.load_csv(table_name)  # replaces table in database with .csv file, but we don't save the database!
+            table_name = table_name[:-4]
+        else:
+            database.load_database(tables=(table_name,))
+        table = getattr(database, table_name)
+
+    query = Query(table).where(*where)
+    if start_date is not None or end_date is not None:
+        query.dates(start_date, end_date)
+    if columns is not None:
+        query.select(*columns)
+    if group_by is not None:
+        query.group_by(*group_by)
+    if sums:
+        query.sum(*sums)
+    if count:
+        query.count()
+    query.order_by(*order_by)
 
     header_cols = []
     data_cols = []
-    header_names = []
-    for name, type in chain(table.row_class.types.items(), table.row_class.calculated.items()):
-        if name not in table.row_class.hidden:
-            header_names.append(name)
-            if type in (int, float, database.Decimal):
-                header_cols.append(Right(bold=True))
-                data_cols.append(Right())
-            else:
-                header_cols.append(Left(bold=True))
-                data_cols.append(Left())
+    header_names = query.headers
+    for name in header_names:
+        if query.header_type(name) in (int, float, database.Decimal):
+            header_cols.append(Right(bold=True))
+            data_cols.append(Right())
+        else:
+            header_cols.append(Left(bold=True))
+            data_cols.append(Left())
     assert len(header_cols) == len(data_cols) == len(header_names), \
            f"ERROR: {len(header_cols)=}, {len(data_cols)=}, {len(header_names)=}"
 
@@ -696,10 +751,9 @@ def dump_table(table_name, pdf=False, default_fontsize=13):
           )
     report.new_row('title', table_name)
     report.new_row('headers', *(table.row_class.abbr.get(name, name) for name in header_names))
-    for row in table.values():
+    for values in query:
         data = report.new_row('data')
-        for name in header_names:
-            value = getattr(row, name)
+        for value in values:
             if value is None:
                 data.next_cell()
             elif isinstance(value, database.date):
@@ -710,8 +764,8 @@ def dump_table(table_name, pdf=False, default_fontsize=13):
     if pdf:
         report.draw_init()
         report.draw()
-        Canvas.showPage()
-        Canvas.save()
+        canvas_showPage()
+        canvas_save()
     else:
         report.print_init()
         report.print(header_row=1)
@@ -763,8 +817,8 @@ def dump_data(report_name, headers, data, pdf=False, default_fontsize=13):
     if pdf:
         report.draw_init()
         report.draw()
-        Canvas.showPage()
-        Canvas.save()
+        canvas_showPage()
+        canvas_save()
     else:
         report.print_init()
         report.print(header_row=1)
@@ -776,11 +830,29 @@ def run():
     parser = argparse.ArgumentParser()
     parser.add_argument("--pdf", "-p", action="store_true", default=False)
     parser.add_argument("--size", "-s", type=int, default=13, help="fontsize (default 13)")
+    parser.add_argument("--where", "-w", action="append", default=[],
+                        help="name<op>value, op is one of = != < <= > >=, may be repeated")
+    parser.add_argument("--from", "-f", dest="start_date", default=None, help="first date")
+    parser.add_argument("--to", dest="end_date", default=None, help="last date")
+    parser.add_argument("--columns", "-c", default=None, help="comma separated column names")
+    parser.add_argument("--group-by", "-g", default=None, help="comma separated column names")
+    parser.add_argument("--sum", "-S", default=None, help="comma separated column names to sum")
+    parser.add_argument("--count", "-n", action="store_true", default=False, help="count the rows")
+    parser.add_argument("--order-by", "-o", default=None,
+                        help="comma separated column names, prefix with ~ for descending "
+                             "(or with -, written as --order-by=-col)")
     parser.add_argument("table")
 
     args = parser.parse_args()
 
-    dump_table(args.table, args.pdf, args.size)
+    def names(arg):
+        if arg is None:
+            return None
+        return tuple(name.strip().lower() for name in arg.split(','))
+
+    dump_table(args.table, args.pdf, args.size, where=args.where, start_date=args.start_date,
+               end_date=args.end_date, columns=names(args.columns), group_by=names(args.group_by),
+               sums=names(args.sum) or (), count=args.count, order_by=names(args.order_by) or ())
 
 
 
@@ -3,7 +3,12 @@
 from decimal import Decimal, InvalidOperation
 from datetime import date, datetime, timedelta
 import math
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from operator import attrgetter, is_not
+from functools import partial, wraps
+from itertools import count
+import re
+from weakref import WeakValueDictionary
 
 
 TUESDAY  = 1
@@ -16,6 +21,153 @@ class CheckInventory(Exception):
 def set_database(database):
     global Database
     Database = database
+    if Cached_references:
+        references_changed()
+
+def get_database():
+    return Database
+
+Cached_references = {}     # {table_name: {id(row): row}}, the rows with references to table_name stored
+                           # on them (see reference).  These are weak, so deleted rows aren't kept.
+
+def references_changed(table_name=None):
+    r'''Called when rows in table_name that might be referenced are replaced or deleted, or with no
+    table_name when the database is switched.  This drops the cached references to table_name (or all of
+    them), so that they get looked up again.
+
+    Adding rows with new keys doesn't change any references, so it doesn't need this.
+    '''
+    table_names = list(Cached_references.keys()) if table_name is None else (table_name,)
+    for name in table_names:
+        rows = Cached_references.pop(name, None)
+        if rows:
+            for row in rows.values():
+                for ref_name in row.references_to[name]:
+                    row.__dict__.pop(ref_name, None)
+
+Versions = count(1)     # see new_version
+
+def new_version():
+    r'''Returns a new version number, for base_table.version (in table.py) and row.changes.
+
+    These are unique across all tables, so a new table (e.g., a fork's copy) never matches an old version.
+    '''
+    return next(Versions)
+
+def hooked_setattr(row, name, value):
+    r'''__setattr__ for rows.  Updates the references (see reference) and indexes (see
+    base_table.create_index in table.py) on name, and marks the row class changed (see cached).
+    '''
+    object.__setattr__(row, name, value)
+    type(row).changes = next(Versions)
+    for ref_name in row.references_on.get(name, ()):
+        row.__dict__.pop(ref_name, None)
+    indexes = row.indexes_on.get(name)
+    if indexes:
+        for index in tuple(indexes):
+            index.row_changed(row)
+
+class reference:
+    r'''A property returning the row in table_name whose primary key is this row's attrs.
+
+    The row found is stored on this row (hiding this property), so later reads are plain attribute
+    reads.  It is dropped when one of attrs is set, and by references_changed().  Changes to the attrs
+    of the referenced row are seen directly.
+
+    If nullable is True, the reference is None when any of the attrs is None.
+    '''
+    def __init__(self, table_name, *attrs, nullable=False):
+        self.table_name = table_name
+        self.attrs = attrs
+        self.get_key = attrgetter(*attrs)
+        self.nullable = nullable
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        if 'references_on' not in vars(owner):
+            owner.references_on = {attr: names.copy() for attr, names in owner.references_on.items()}
+            owner.references_to = {table: names.copy() for table, names in owner.references_to.items()}
+        for attr in self.attrs:
+            owner.references_on.setdefault(attr, set()).add(name)
+        owner.references_to.setdefault(self.table_name, set()).add(name)
+
+    def __get__(self, row, owner=None):
+        if row is None:
+            return self
+        if self.nullable and any(getattr(row, attr) is None for attr in self.attrs):
+            ref = None
+        else:
+            ref = getattr(Database, self.table_name)[self.get_key(row)]
+        row.__dict__[self.name] = ref
+        rows = Cached_references.get(self.table_name)
+        if rows is None:
+            rows = Cached_references[self.table_name] = WeakValueDictionary()
+        rows[id(row)] = row
+        return ref
+
+Caches = []    # all of the cached functions, for cache_stats
+
+class cached:
+    r'''Decorator caching the results of a function (or method) that reads the tables in table_names.
+
+    The results are keyed on the arguments plus the versions of those tables in the active database, and
+    of their row classes (changed when any attr of one of their rows is set).  So a result is reused until
+    one of those tables changes.  The least recently used results are dropped past maxsize.
+
+    For table methods (table_method=True, e.g., Months.avg in table.py), the table itself is keyed on its
+    version rather than the table, which isn't hashable.  The other arguments must be hashable.
+
+    If copy is given, callers get copy(result), so that they may change it.  Otherwise the results must
+    be immutable.
+    '''
+    def __init__(self, *table_names, maxsize=256, table_method=False, copy=None):
+        self.table_names = table_names
+        self.maxsize = maxsize
+        self.table_method = table_method
+        self.copy = copy
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, fn):
+        self.name = fn.__qualname__
+        results = self.results
+        table_names = self.table_names
+        table_method = self.table_method
+        copy = self.copy
+
+        @wraps(fn)
+        def cached_fn(*args, **kwargs):
+            tables = [getattr(Database, name) for name in table_names]
+            if table_method:
+                tables.append(args[0])
+                key_args = args[1:]
+            else:
+                key_args = args
+            key = key_args, tuple(kwargs.items()), \
+                  tuple((table.version, table.row_class.changes) for table in tables)
+            if key in results:
+                self.hits += 1
+                results.move_to_end(key)
+                ans = results[key]
+            else:
+                self.misses += 1
+                ans = results[key] = fn(*args, **kwargs)
+                if len(results) > self.maxsize:
+                    results.popitem(last=False)
+            return ans if copy is None else copy(ans)
+
+        cached_fn.cache = self
+        Caches.append(self)
+        return cached_fn
+
+    def clear(self):
+        self.results.clear()
+
+def cache_stats():
+    r'''Returns [(name, hits, misses, size)] for each cached function.
+    '''
+    return [(cache.name, cache.hits, cache.misses, len(cache.results)) for cache in Caches]
 
 def parse_date(s):
     if isinstance(s, date):
@@ -40,6 +192,77 @@ def parse_bool(s):
         return False
     raise ValueError(f"parse_bool({s=}): not a valid bool value")
 
+class constraint:
+    r'''A constraint on the values of a column (see row.constraints).
+
+    all_ok(values) checks a whole column at once, mostly in C.  ok(value) is only used to find the bad
+    values once all_ok fails.  None values pass, except for not_null.
+    '''
+    def ok(self, value):
+        raise NotImplementedError
+
+    def all_ok(self, values):
+        return all(map(self.ok, values))
+
+class one_of(constraint):
+    def __init__(self, *values):
+        self.values = frozenset(values)
+
+    def __str__(self):
+        return "one of " + ", ".join(map(repr, sorted(self.values)))
+
+    def ok(self, value):
+        return value is None or value in self.values
+
+    def all_ok(self, values):
+        return self.values.union((None,)).issuperset(values)
+
+class in_range(constraint):
+    def __init__(self, min=None, max=None):
+        self.min = min
+        self.max = max
+
+    def __str__(self):
+        if self.max is None:
+            return f">= {self.min}"
+        if self.min is None:
+            return f"<= {self.max}"
+        return f"{self.min} to {self.max}"
+
+    def ok(self, value):
+        return value is None or (self.min is None or value >= self.min) and (self.max is None or value <= self.max)
+
+    def all_ok(self, values):
+        values = list(filter(is_not_none, values))
+        if not values:
+            return True
+        return (self.min is None or min(values) >= self.min) and (self.max is None or max(values) <= self.max)
+
+class not_null(constraint):
+    def __str__(self):
+        return "set"
+
+    def ok(self, value):
+        return value is not None
+
+    def all_ok(self, values):
+        return None not in values
+
+class matches(constraint):
+    def __init__(self, regex):
+        self.regex = re.compile(regex)
+
+    def __str__(self):
+        return f"like {self.regex.pattern!r}"
+
+    def ok(self, value):
+        return value is None or self.regex.match(value) is not None
+
+    def all_ok(self, values):
+        return all(map(self.regex.match, filter(is_not_none, values)))
+
+is_not_none = partial(is_not, None)
+
 class row:
     r'''One row in a database table.
 
@@ -54,9 +277,17 @@ class row:
     primary_key = None
     primary_keys = None
     foreign_keys = ()
+    uses_tables = ()      # other tables used by calculated columns, that aren't foreign_keys
     in_database = True
     hidden = frozenset()  # column names that are excluded from report generated by report.py
     abbr = {}             # {col_name: abbr} for report generated by report.py
+    references_on = {}    # {attr: names of the references that use attr}, see reference
+    references_to = {}    # {table_name: names of the references to table_name}, see reference
+    changes = 0           # new_version() when an attr of any row of this class is last set, see cached
+    constraints = {}      # {attr: constraint or (constraint, ...)}, checked on insert and load
+    indexes_on = {}       # {attr: indexes on attr}, see base_table.create_index in table.py
+
+    __setattr__ = hooked_setattr
 
     def __init__(self, **attrs):
         attrs_in = frozenset(name.strip().lower() for name in attrs.keys())
@@ -66,30 +297,16 @@ class row:
         assert not missing_attrs, f"{self.table_name}.__init__: missing attrs={tuple(missing_attrs)}, {attrs.keys()=}"
         for name, value in attrs.items():
             name = name.strip().lower()
-            setattr(self, name, self.types[name](value))
+            self.__dict__[name] = self.types[name](value)    # new rows have no indexes or references yet
 
-    def check_foreign_keys(self, row_num, raise_exc=True):
-        r'''Returns True if all tests pass.
+    def __copy__(self):
+        r'''Copies the attrs, but not the cached references (see reference).
         '''
-        ans = True
-        for table_name in self.foreign_keys:
-            table = getattr(Database, table_name)
-            if table.row_class.primary_key is not None:
-                key = getattr(self, table.row_class.primary_key)
-                if key is None:
-                    continue
-            else:
-                key = tuple(getattr(self, key) for key in table.row_class.primary_keys)
-                if any(k is None for k in key):
-                    continue
-            if key not in table:
-                error_msg = f"{self.__class__.__name__}.check_foreign_keys({row_num=}): " \
-                            f"{key=} not in {table_name}"
-                if raise_exc:
-                    raise KeyError(error_msg)
-                else:
-                    print(error_msg)
-                ans = False
+        ans = self.__class__.__new__(self.__class__)
+        ans.__dict__.update(self.__dict__)
+        for names in self.references_on.values():
+            for name in names:
+                ans.__dict__.pop(name, None)
         return ans
 
     @classmethod
@@ -117,6 +334,15 @@ class row:
                 attrs[name] = cls.types[name](value)
         return cls(**attrs)
 
+    @classmethod
+    def from_typed(cls, attrs):
+        r'''Returns a new row with attrs, which are already converted by cls.types (see typed_rows in
+        table.py).
+        '''
+        row = cls.__new__(cls)
+        row.__dict__.update(attrs)
+        return row
+
     def csv_value(self, name):
         value = getattr(self, name)
         if value is None:
@@ -180,6 +406,12 @@ class Items(row):
     primary_key = 'item'
     required = frozenset(("item", "unit", "perishable"))
     foreign_keys = "Products",
+    constraints = dict(
+        supplier_id=in_range(1),
+        num_per_meal=in_range(0),
+        num_per_table=in_range(0),
+        num_per_serving=in_range(0),
+    )
     calculated = dict(
         pkg_size=int,
         pkg_weight=float,
@@ -189,11 +421,7 @@ class Items(row):
                           "min_needed1 max_order min_needed2 min_needed3 order".split()
     order_stats_row_type = namedtuple("order_stats", order_stats_headers)
 
-    @property
-    def product(self):
-        if self.supplier is None or self.supplier_id is None:
-            return None
-        return Database.Products[self.item, self.supplier, self.supplier_id]
+    product = reference("Products", "item", "supplier", "supplier_id", nullable=True)
 
     @property
     def pkg_size(self):
@@ -209,29 +437,11 @@ class Items(row):
 
     def in_stock(self, verbose=False):
         r'''Return units, uncertainty.
+
+        This is kept as a checkpoint of this item's Inventory rows since its last count (see Stock_index in
+        table.py).
         '''
-        units = 0
-        uncertainty = 0
-        for inv in Database.Inventory.values():
-            if inv.item == self.item:
-                match inv.code:
-                    case "count":
-                        units = inv.total_units
-                        uncertainty = inv.uncertainty
-                    case "purchased":  # exact count
-                        units += inv.total_units
-                    case "used":       # may be exact count
-                        units -= inv.total_units
-                        uncertainty += inv.uncertainty
-                    case "consumed":   # estimate
-                        units -= inv.total_units
-                        uncertainty += inv.uncertainty
-                    case "estimate":   # includes uncertainty
-                        units = inv.total_units
-                        uncertainty = inv.uncertainty
-                    case _:
-                        raise AssertionError(f"Item({self.item}).in_stock: unknown Inventory.code={inv.code}")
-        return units, uncertainty
+        return Database.Inventory.stock(self.item)
 
     def consumed(self, num_served, table_size=6, verbose=False):
         r'''Returns the number of units consumed at breakfast.
@@ -255,8 +465,10 @@ class Items(row):
                 print(f"{self.item}.consumed: no consumption set, {ans=}")
         return round(ans)
 
-    def order_stats(self, cur_month, table_size=6, override=False, verbose=False):
+    def order_stats(self, cur_month, table_size=6, override=False, verbose=False, stock=None):
         r'''Returns order_stats_row_type (stored on this class).
+
+        stock is (units, uncertainty) from Inventory.stock_levels (in table.py), or None to use in_stock.
         '''
         def calc_needed(num_servings):
             r'''Calculates total needed to cover num_servings.
@@ -283,7 +495,7 @@ class Items(row):
             return ans
 
         stats = [self.item, self.unit, self.pkg_size, self.perishable]
-        units, uncertainty = self.in_stock(verbose=verbose)
+        units, uncertainty = stock if stock is not None else self.in_stock(verbose=verbose)
         stats.extend((units, uncertainty))
 
 
@@ -334,10 +546,10 @@ class Items(row):
         stats.append(round(max(min1, min2, min3)))
         return self.order_stats_row_type(*stats)
 
-    def order(self, cur_month, table_size=6, override=False, verbose=False):
+    def order(self, cur_month, table_size=6, override=False, verbose=False, stock=None):
         r'''Returns how many pkgs to order.
         '''
-        return self.order_stats(cur_month, table_size, override, verbose).order
+        return self.order_stats(cur_month, table_size, override, verbose, stock).order
 
 class Products(row):
     # item=varchar(30, references=foreign_key("Items", on_delete="cascade", on_update="cascade")),
@@ -378,15 +590,23 @@ class Products(row):
     primary_keys = "item", "supplier", "supplier_id"
     required = frozenset(("item", "supplier", "name", "price"))
     foreign_keys = "Items",
+    constraints = dict(
+        supplier_id=in_range(1),
+        price=in_range(0),
+        pkg_size=in_range(1),
+        pkg_weight=in_range(0),
+    )
     calculated = dict(
         unit=str,
         price_per_unit=float,
         oz_per_unit=float,
     )
 
+    item_row = reference("Items", "item")
+
     @property
     def unit(self):
-        return Database.Items[self.item].unit
+        return self.item_row.unit
 
     @property
     def price_per_unit(self):
@@ -427,16 +647,47 @@ class Inventory(row):
     primary_keys = "date item code".split()
     required = frozenset(("date", "item", "code"))
     foreign_keys = "Items",
+    codes = frozenset(("count", "purchased", "used", "consumed", "estimate"))   # see apply_to
+    resets = frozenset(("count", "estimate"))   # codes that set the stock, rather than change it
+    constraints = dict(
+        code=one_of(*codes),
+        num_pkgs=in_range(0),
+        num_units=in_range(0),
+        uncertainty=in_range(0),
+    )
     calculated = dict(pkg_size=int, total_units=float)
 
+    item_row = reference("Items", "item")
+
     @property
     def pkg_size(self):
-        return Database.Items[self.item].pkg_size
+        return self.item_row.pkg_size
 
     @property
     def total_units(self):
+        if not self.num_pkgs:
+            return self.num_pkgs + self.num_units     # doesn't need a product (see cascade.py)
         return self.num_pkgs * self.pkg_size + self.num_units
 
+    def apply_to(self, units, uncertainty):
+        r'''Returns units, uncertainty after this row is applied to them.
+
+        This is how Items.in_stock replays the Inventory rows for an item.
+        '''
+        match self.code:
+            case "count":
+                return self.total_units, self.uncertainty
+            case "purchased":  # exact count
+                return units + self.total_units, uncertainty
+            case "used":       # may be exact count
+                return units - self.total_units, uncertainty + self.uncertainty
+            case "consumed":   # estimate
+                return units - self.total_units, uncertainty + self.uncertainty
+            case "estimate":   # includes uncertainty
+                return self.total_units, self.uncertainty
+            case _:
+                raise AssertionError(f"Item({self.item}).in_stock: unknown Inventory.code={self.code}")
+
 class Orders(row):
     # item=varchar(30),
     # qty=integer(null=True),             # None if no P.O. was created, and purchased_units used.
@@ -469,21 +720,27 @@ class Orders(row):
    #primary_keys = "date", "item"
     required = frozenset(("item",))
     foreign_keys = "Items", "Products"
+    constraints = dict(
+        qty=in_range(0),
+        supplier_id=in_range(1),
+        purchased_pkgs=in_range(0),
+        purchased_units=in_range(0),
+        price=in_range(0),
+    )
     calculated = dict(
         unit=str,
         pkg_size=int,
         pkg_weight=float,
     )
 
-    @property
-    def item_row(self):
-        return Database.Items[self.item]
+    item_row = reference("Items", "item")
+    product_row = reference("Products", "item", "supplier", "supplier_id", nullable=True)
 
     @property
     def product(self):
         if self.supplier is None or self.supplier_id is None:
             return self.item_row.product
-        return Database.Products[self.item, self.supplier, self.supplier_id]
+        return self.product_row
 
     @property
     def unit(self):
@@ -546,6 +803,14 @@ class Months(row):
     consumed_fudge = None
     primary_keys = "year", "month"
     required = frozenset(("month", "year"))
+    constraints = dict(
+        month=in_range(1, 12),
+        num_at_meeting=in_range(0),
+        staff_at_breakfast=in_range(0),
+        tickets_claimed=in_range(0),
+        served_fudge=in_range(0),
+        consumed_fudge=in_range(0),
+    )
     calculated = dict(
         month_str=str,
         meals_served=int,
@@ -619,6 +884,9 @@ class Accounts(row):
     type = None
     primary_key = "account"
     required = frozenset(("account",))
+    constraints = dict(
+        type=one_of("Revenue", "Expenses", "Bank", "Cash"),   # see cash_balance.py
+    )
     calculated = dict()
 
 class bills:
@@ -749,23 +1017,35 @@ class Starts(row, bills):  # row first, so it's __init__ is used.
     required = frozenset(("account", "detail"))
     primary_keys = "account", "detail"
     foreign_keys = "Accounts",
+    constraints = {name: in_range(0) for name in bills.types}
     calculated = bills.calculated.copy()
     calculated["section"] = str
     calculated["category"] = str
     calculated["type"] = str
     hidden = row.hidden.union(("section", "category", "type"))
 
+    account_row = reference("Accounts", "account")
+
     @property
     def section(self):
-        return Database.Accounts[self.account].section
+        return self.account_row.section
 
     @property
     def category(self):
-        return Database.Accounts[self.account].category
+        return self.account_row.category
 
     @property
     def type(self):
-        return Database.Accounts[self.account].type
+        return self.account_row.type
+
+@cached("Starts", copy=bills.copy)
+def total_starts():
+    r'''Returns the total of the "start" rows in Starts, as new bills.
+    '''
+    ans = bills()
+    for start in Database.Starts.lookup(detail='start'):
+        ans += start
+    return ans
 
 class Reconcile(Starts):
     # date=date_col(),
@@ -784,6 +1064,8 @@ class Reconcile(Starts):
     donations = 0
     required = frozenset(("date", "account"))
     primary_keys = None
+    uses_tables = "Globals", "Starts"
+    constraints = dict(Starts.constraints, donations=in_range(0))
     calculated = Starts.calculated.copy()
     calculated.update(dict(
         total=Decimal,
@@ -814,10 +1096,68 @@ class Reconcile(Starts):
             total -= Database.Starts[start_key].total
         return int(math.ceil(total / price))
 
+class Imports(row):
+    # hash=varchar(16),            # see import_hashes in table.py
+    # table_name=varchar(20),      # table the row was imported into, e.g., "Reconcile"
+    # date=date_col(),             # date imported
+    types = dict(
+        hash=str,
+        table_name=str,
+        date=parse_date,
+    )
+
+    primary_key = "hash"
+    required = frozenset(("hash", "table_name", "date"))
+    constraints = dict(
+        hash=matches(r'[0-9a-f]+$'),
+    )
+    calculated = dict()
+
+Value_types = (    # (type, converter, regex), in the order tried by value_type
+    (int, int, re.compile(r'[+-]?\d+$')),
+    (date, parse_date, re.compile(r'\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$|'
+                                  r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) ([1-9]|0[1-9]|[12]\d|3[01]), \d\d$')),
+    (Decimal, Decimal, re.compile(r'[+-]?\d*\.\d\d$')),     # has 2 digits after the '.'
+    (float, float, re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')),
+)
+
+Converters = {type: converter for type, converter, _ in Value_types}
+Converters[str] = str
+
+def value_type(s):
+    r'''Returns the type of the stripped string s (int, date, Decimal, float or str), or None if s is empty.
+    '''
+    if s == "":
+        return None
+    for type, _, regex in Value_types:
+        if regex.match(s):
+            return type
+    return str
+
+Maybe_value = re.compile(r'.*\d|[+-]?(nan|inf|infinity)$', re.IGNORECASE)   # for try_converters
+
 def convert(s):
+    r'''Returns the stripped string s as an int, date, Decimal or float, or as a str if it isn't one.
+
+    The type is picked by value_type.  Values that it doesn't pick, or that its converter rejects (e.g.,
+    "Feb 30, 25", "1_000" or "nan"), go through try_converters.
+    '''
     s = s.strip()
-    if s == "":
+    type = value_type(s)
+    if type is None:
         return None
+    if type is not str:
+        try:
+            return Converters[type](s)
+        except ValueError:
+            pass
+    elif not Maybe_value.match(s):
+        return s
+    return try_converters(s)
+
+def try_converters(s):
+    r'''Returns the stripped string s converted by the first converter that accepts it, else s.
+    '''
     try:
         return int(s)
     except ValueError:
@@ -848,10 +1188,11 @@ def convert(s):
 Rows = (Items, Products,
         Inventory, Orders, Months,
         Globals, Accounts, Starts, Reconcile,
+        Imports,
        )
 
 
-__all__ = "CheckInventory Decimal date datetime timedelta set_database bills Rows abbr_month".split()
+__all__ = "CheckInventory Decimal date datetime timedelta set_database get_database bills Rows abbr_month".split()
 
 
 
@@ -16,7 +16,7 @@ def run():
 
     today = date.today()
 
-    load_database()
+    load_database(tables=("Months",))
 
     cur_month = Months[today.year, today.month]
 
@@ -16,7 +16,7 @@ from database import *
 def run():
     today = date.today()
 
-    load_database()
+    load_database(tables=("Months",))
 
     cur_month = Months.last_month()
 
@@ -0,0 +1,52 @@
+# sql_query.py
+
+r'''Runs a SQL query against the SQLite export of the database and shows the results.
+
+The export (see export_sqlite.py) is brought up to date first.  Only the tables that have changed
+are rewritten.
+
+Examples:
+
+    python sql_query.py "select strftime('%Y', date) as year, sum(num_pkgs) from Inventory
+                         where item = 'Bacon' and code = 'purchased' group by year"
+
+    python sql_query.py -T "50/50" "select date, total from Reconcile where account = '50/50'"
+'''
+
+from database import *
+from report import dump_data
+from export_sqlite import SQLite_filename, connect, export_database
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", "-p", action="store_true", default=False)
+    parser.add_argument("--size", "-s", type=int, default=13, help="fontsize (default 13)")
+    parser.add_argument("--title", "-T", default="Query", help="report title (and pdf filename)")
+    parser.add_argument("--no-export", "-n", action="store_true", default=False,
+                        help="query the existing SQLite file without refreshing it")
+    parser.add_argument("--sqlite-file", "-f", default=SQLite_filename)
+    parser.add_argument("sql")
+
+    args = parser.parse_args()
+
+    if not args.no_export:
+        load_database()
+        export_database(args.sqlite_file)
+
+    conn = connect(args.sqlite_file)
+    try:
+        cursor = conn.execute(args.sql)
+        headers = [col[0] for col in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    dump_data(args.title, headers, rows, args.pdf, args.size)
+
+
+
+if __name__ == "__main__":
+    run()
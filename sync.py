@@ -0,0 +1,239 @@
+# sync.py
+
+r'''Syncs two (or more) copies of beans.csv, e.g., on the phone and the laptop, through delta files.
+
+    python sync.py --init -r phone      # once on each copy, starting from the same beans.csv
+    python sync.py -r phone             # imports the other copies' deltas, then exports this copy's delta
+    python sync.py -r laptop --import-only
+
+The deltas are db_diff.py patches of just the rows changed since the last sync, so they stay small no
+matter how big beans.csv gets.  They are dropped in --folder (default "sync"), which can be any folder
+that both copies see (a shared drive, a USB stick, Syncthing, ...), as <replica>-<seq>.patch.  Each
+replica numbers its deltas 1, 2, 3, ...  and remembers the last seq that it imported from each of the
+others, so a delta is only imported once.
+
+Each replica also keeps the database as of its last sync (its base) in Sync_dir, named by its content
+hash.  A delta is made from this replica's base, and records that base's hash.  Importing a delta applies
+it to a copy of the same base (so it always applies cleanly), and then merges the result into beans.csv
+with merge.py's three-way merge.  Conflicts are printed, and take the --favor side (default ours).  Rows
+that both replicas added at the same place are kept in replica name order, so both get the same order.
+The merged result goes out in this replica's next delta, so both copies end up the same.
+'''
+
+import csv
+import hashlib
+import os
+import re
+import shutil
+
+from table import Database_filename, load_database, write_tables, CSV_dialect, CSV_format, Import_hash_len
+from db_diff import read_database, diff_databases, write_patch, apply_patch, primary_key_columns
+from merge import merge_files
+
+
+Sync_dir = ".sync"          # local to this replica, not shared
+Keep_bases = 10             # base snapshots kept in Sync_dir
+
+Patch_re = re.compile(r'(?P<replica>.+)-(?P<seq>\d+)\.patch$')
+
+
+def content_hash(tables):
+    r'''Returns the hash of the {table_name: Raw_table} (see db_diff.read_database).
+
+    This ignores padding and the order of the rows in tables with a primary key, so the same rows hash
+    the same on both replicas.
+    '''
+    sha1 = hashlib.sha1()
+    for name in sorted(tables.keys()):
+        table = tables[name]
+        rows = table.rows
+        if primary_key_columns(name) is not None:
+            rows = sorted(rows)
+        sha1.update('|'.join((name,) + table.header).encode())
+        for row in rows:
+            sha1.update(('\n' + '|'.join(row)).encode())
+        sha1.update(b'\n\n')
+    return sha1.hexdigest()[:Import_hash_len]
+
+def base_filename(hash):
+    return os.path.join(Sync_dir, f"{hash}.csv")
+
+def save_base(csv_filename):
+    r'''Copies csv_filename into Sync_dir as a base.  Returns its hash.
+    '''
+    hash = content_hash(read_database(csv_filename))
+    if not os.path.exists(base_filename(hash)):
+        shutil.copyfile(csv_filename, base_filename(hash))
+    return hash
+
+def prune_bases(keep):
+    r'''Deletes all but the Keep_bases newest bases, never deleting the base hash `keep`.
+    '''
+    bases = sorted((name for name in os.listdir(Sync_dir) if name.endswith(".csv")),
+                   key=lambda name: os.path.getmtime(os.path.join(Sync_dir, name)), reverse=True)
+    for name in bases[Keep_bases:]:
+        if name != f"{keep}.csv":
+            os.remove(os.path.join(Sync_dir, name))
+
+
+class sync_state:
+    r'''This replica's name, base, last seq exported, and last seq imported from each of the others.
+
+    Stored in Sync_dir/state.csv as name|value lines.
+    '''
+    def __init__(self, replica):
+        self.replica = replica
+        self.filename = os.path.join(Sync_dir, "state.csv")
+        assert os.path.exists(self.filename), f"{self.filename} not found, run sync.py --init first"
+        with open(self.filename, 'r') as f:
+            values = {name.strip(): value.strip() for name, value in csv.reader(f, CSV_dialect, **CSV_format)}
+        assert values["replica"] == replica, \
+               f"sync_state: this is replica {values['replica']!r}, not {replica!r}"
+        self.base = values["base"]
+        self.sent = int(values["sent"])
+        self.received = {name[9:]: int(value) for name, value in values.items()
+                         if name.startswith("received-")}
+
+    @classmethod
+    def init(cls, replica, csv_filename=Database_filename):
+        os.makedirs(Sync_dir, exist_ok=True)
+        state = cls.__new__(cls)
+        state.replica = replica
+        state.filename = os.path.join(Sync_dir, "state.csv")
+        state.base = save_base(csv_filename)
+        state.sent = 0
+        state.received = {}
+        state.save()
+        return state
+
+    def save(self):
+        temp_filename = self.filename + "-new"
+        with open(temp_filename, 'w') as f:
+            print(f"replica|{self.replica}", file=f)
+            print(f"base|{self.base}", file=f)
+            print(f"sent|{self.sent}", file=f)
+            for replica, seq in sorted(self.received.items()):
+                print(f"received-{replica}|{seq}", file=f)
+        os.replace(temp_filename, self.filename)
+
+def read_header(patch_filename):
+    r'''Returns {name: value} from the "#" lines at the top of a delta.
+    '''
+    ans = {}
+    with open(patch_filename, 'r') as f:
+        for line in f:
+            if not line.startswith('#'):
+                break
+            name, _, value = line[1:].partition('|')
+            ans[name.strip()] = value.strip()
+    return ans
+
+def pending(folder, state):
+    r'''Returns [(replica, seq, patch_filename)] for the other replicas' deltas not yet imported, in order.
+    '''
+    ans = []
+    for name in os.listdir(folder):
+        match = Patch_re.match(name)
+        if match and match['replica'] != state.replica:
+            seq = int(match['seq'])
+            if seq > state.received.get(match['replica'], 0):
+                ans.append((match['replica'], seq, os.path.join(folder, name)))
+    ans.sort()
+    return ans
+
+def export_delta(folder, state, csv_filename=Database_filename):
+    r'''Writes the rows changed since state.base to folder.  Returns the patch filename, or None if there
+    are no changes.
+    '''
+    current = read_database(csv_filename)
+    hash = content_hash(current)
+    if hash == state.base:
+        return None
+    diffs = diff_databases(read_database(base_filename(state.base)), current)
+    state.sent += 1
+    patch_filename = os.path.join(folder, f"{state.replica}-{state.sent}.patch")
+    temp_filename = patch_filename + "-new"
+    with open(temp_filename, 'w') as f:
+        print(f"#replica|{state.replica}", file=f)
+        print(f"#seq|{state.sent}", file=f)
+        print(f"#base|{state.base}", file=f)
+        print(f"#new|{hash}", file=f)
+        write_patch(diffs, f)
+    os.replace(temp_filename, patch_filename)   # so the other replica never sees half of it
+    state.base = save_base(csv_filename)
+    state.save()
+    return patch_filename
+
+def import_delta(patch_filename, state, csv_filename=Database_filename, favor="ours", trial_run=False):
+    r'''Applies the delta to its base, and merges the result into csv_filename.  Returns the conflicts.
+    '''
+    header = read_header(patch_filename)
+    base = base_filename(header["base"])
+    assert os.path.exists(base), \
+           f"{patch_filename}: base {header['base']} not found in {Sync_dir} (too old, or another --init?)"
+    load_database(base, skip_fk_check=True)
+    errors = apply_patch(patch_filename)
+    assert not errors, f"{patch_filename}: {errors} foreign key errors after applying it to its base"
+    theirs = os.path.join(Sync_dir, "theirs.csv")
+    with open(theirs, 'w') as f:
+        write_tables(f)
+    new_hash = content_hash(read_database(theirs))
+    assert new_hash == header["new"], \
+           f"{patch_filename}: got {new_hash} applying it to its base, expected {header['new']}"
+    if not trial_run:
+        shutil.copyfile(csv_filename, csv_filename[:-4] + '-save.csv')
+    # rows added on both sides go in replica name order, so both replicas end up the same
+    conflicts = merge_files(base, csv_filename, theirs, csv_filename, favor, trial_run,
+                            theirs_first=header["replica"] < state.replica)
+    if trial_run:
+        os.remove(theirs)
+    else:
+        os.replace(theirs, base_filename(new_hash))
+        state.base = new_hash
+        state.received[header["replica"]] = int(header["seq"])
+        state.save()
+    return conflicts
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trial-run", "-t", action="store_true", default=False)
+    parser.add_argument("--replica", "-r", required=True, help="name of this copy, e.g., phone or laptop")
+    parser.add_argument("--folder", "-f", default="sync", help="folder shared with the other copies")
+    parser.add_argument("--favor", choices=("ours", "theirs"), default="ours",
+                        help="side taken for conflicting values")
+    parser.add_argument("--init", action="store_true", default=False,
+                        help="start syncing from the current beans.csv")
+    parser.add_argument("--import-only", "-i", action="store_true", default=False)
+
+    args = parser.parse_args()
+
+    if args.init:
+        state = sync_state.init(args.replica)
+        print(f"{args.replica}: syncing from base {state.base}")
+        return
+
+    state = sync_state(args.replica)
+    os.makedirs(args.folder, exist_ok=True)
+    for replica, seq, patch_filename in pending(args.folder, state):
+        conflicts = import_delta(patch_filename, state, favor=args.favor, trial_run=args.trial_run)
+        for conflict in conflicts:
+            print(conflict)
+        print(f"Imported {patch_filename}: {len(conflicts)} conflicts")
+    if args.trial_run:
+        print("Trial_run: Database not saved, nothing exported")
+        return
+    if not args.import_only:
+        patch_filename = export_delta(args.folder, state)
+        if patch_filename is None:
+            print("No changes to export")
+        else:
+            print(f"Exported {patch_filename}: {os.path.getsize(patch_filename)} bytes")
+    prune_bases(state.base)
+
+
+
+if __name__ == "__main__":
+    run()
@@ -3,13 +3,31 @@
 import os
 import os.path
 import csv
+import copy
+import weakref
+import hashlib
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from operator import attrgetter
 from statistics import mean
 
 from row import *
+from row import parse_date, references_changed, new_version, cached, cache_stats, total_starts
 
 
 Database_filename = "beans.csv"
 
+# Low-resource mode (see README)
+Low_resource = bool(os.environ.get("BEANS_LOW_RESOURCE"))
+Max_memory_mb = os.environ.get("BEANS_MAX_MEMORY_MB")
+
+Skipped_tables = set()   # tables not loaded by the last load_database
+Loaded_tables = {}       # {table_name: (file_stamp, version, changes)} as of the last load or save
+
+Batch_size = 1000        # rows per insert_many in load_side_file
+
+Import_hash_len = 16     # hex digits kept of the sha1 in the Imports table
+
 CSV_dialect = 'excel'  # 'excel', 'excel-tab' or 'unix'
 CSV_format = dict(delimiter='|', quoting=csv.QUOTE_NONE, skipinitialspace=True, strict=True)
 
@@ -19,23 +37,450 @@ def align(value, width, alignment):
         return ' ' * (width - len(value)) + value
     return value + ' ' * (width - len(value))
 
+class Foreign_key:
+    r'''A foreign key relationship, compiled once: from_table rows reference to_table rows.
+
+    extract(row) returns the referenced key (a tuple if to_table has primary_keys).  Keys with a None
+    in them are not checked.
+
+    null_attrs are the attrs that from_table rows don't require (e.g., Items.supplier and supplier_id
+    for Items -> Products).  If there are any, the reference is optional, and deleting the to_table row
+    sets these to None rather than deleting the from_table row (see cascade.py).
+    '''
+    def __init__(self, row_class, to_table):
+        self.from_table = row_class.__name__
+        self.to_table = to_table
+        to_class = Tables[to_table].row_class
+        if to_class.primary_key is not None:
+            self.attrs = (to_class.primary_key,)
+            self.is_null = lambda key: key is None
+        else:
+            self.attrs = tuple(to_class.primary_keys)
+            self.is_null = lambda key: None in key
+        self.extract = attrgetter(*self.attrs)
+        self.null_attrs = tuple(attr for attr in self.attrs if attr not in row_class.required)
+
+    def __repr__(self):
+        return f"{self.from_table} -> {self.to_table}"
+
+    def keys(self, rows):
+        r'''Returns the set of keys referenced by rows.
+        '''
+        is_null = self.is_null
+        return {key for key in map(self.extract, rows) if not is_null(key)}
+
+    def missing(self, rows, database=None):
+        r'''Returns the set of keys referenced by rows that aren't in to_table.
+        '''
+        if database is None:
+            database = get_database()
+        return self.keys(rows) - getattr(database, self.to_table).keys()
+
+    def referencing(self, key, database=None):
+        r'''Returns the from_table rows that reference key.
+
+        This uses an index on the from_table (the reverse foreign key index), which is created on first
+        use and then maintained with the table.
+        '''
+        if database is None:
+            database = get_database()
+        return getattr(database, self.from_table).create_index(*self.attrs).lookup(key)
+
+    def error(self, rows, missing):
+        r'''Returns the error message for the missing keys, with the row numbers that reference them.
+        '''
+        row_nums = {}
+        for row_num, row in enumerate(rows, 1):
+            key = self.extract(row)
+            if key in missing:
+                row_nums.setdefault(key, []).append(row_num)
+        if len(row_nums) == 1 and len(rows) == 1:
+            return f"{self!r}: key={next(iter(row_nums))!r} not found"
+        return f"{self!r}: " + ", ".join(f"key={key!r} not found (rows {', '.join(map(str, nums))})"
+                                        for key, nums in row_nums.items())
+
+Compiled_foreign_keys = {}    # {table_name: (Foreign_key, ...)}
+
+def foreign_keys_from(row_class):
+    r'''Returns the compiled Foreign_keys for row_class.
+    '''
+    ans = Compiled_foreign_keys.get(row_class.__name__)
+    if ans is None:
+        ans = tuple(Foreign_key(row_class, to_table) for to_table in row_class.foreign_keys)
+        Compiled_foreign_keys[row_class.__name__] = ans
+    return ans
+
+Compiled_constraints = {}    # {table_name: ((attr, getter, (constraint, ...)), ...)}
+
+def constraints_of(row_class):
+    r'''Returns the compiled constraints for row_class (see row.constraints).
+    '''
+    ans = Compiled_constraints.get(row_class.__name__)
+    if ans is None:
+        ans = tuple((attr, attrgetter(attr), constraints if isinstance(constraints, tuple) else (constraints,))
+                    for attr, constraints in row_class.constraints.items())
+        Compiled_constraints[row_class.__name__] = ans
+    return ans
+
+def foreign_keys_to(table_name):
+    r'''Returns the compiled Foreign_keys that reference table_name.
+    '''
+    return tuple(fk for table in Tables.values() for fk in foreign_keys_from(table.row_class)
+                    if fk.to_table == table_name)
+
+def foreign_key_errors(database=None, table_names=None):
+    r'''Checks all of the foreign keys from or to table_names (default all tables) in database.
+
+    Returns a list of error messages, one per relationship with missing keys.
+    '''
+    if database is None:
+        database = get_database()
+    errors = []
+    for table in Tables.values():
+        for fk in foreign_keys_from(table.row_class):
+            if table_names is None or fk.from_table in table_names or fk.to_table in table_names:
+                rows = list(getattr(database, fk.from_table).values())
+                missing = fk.missing(rows, database)
+                if missing:
+                    errors.append(fk.error(rows, missing))
+    return errors
+
+class Index:
+    r'''A hash index on one or more attrs of the rows in a table: {value: [row, ...]}.
+
+    The value is a tuple if there is more than one attr.  The rows in each bucket are in table order, except
+    that they are in date order (ties in table order) if the rows have dates (see by_date).
+
+    The index is kept up to date by the table as rows are added, replaced or deleted, and by the rows
+    when an indexed attr is set (see hooked_setattr in row.py).  Bulk changes (loads, clear) mark it stale, and it is rebuilt on the
+    next lookup.  The by_date buckets are kept in date order even when a row's date is set.
+    '''
+    def __init__(self, table, attrs):
+        self.table = table
+        self.attrs = attrs
+        self.get_key = attrgetter(*attrs)
+        if isinstance(table, table_by_date):
+            self.by_date = table.dated
+        else:
+            # e.g., Inventory, which is kept in the order the rows were added
+            self.by_date = 'date' in table.row_class.required
+        self.buckets = None       # {key: [row]}, None when stale
+        self.row_keys = {}        # {id(row): key}
+
+    def __repr__(self):
+        return f"<Index {self.table.name}({', '.join(self.attrs)})>"
+
+    def watched_attrs(self):
+        r'''Returns the attrs whose changes row_changed is called for.
+        '''
+        return self.attrs + (('date',) if self.by_date and 'date' not in self.attrs else ())
+
+    def rebuild(self):
+        self.buckets = {}
+        self.row_keys = {}
+        get_key = self.get_key
+        for row in self.table.values():
+            key = get_key(row)
+            self.buckets.setdefault(key, []).append(row)
+            self.row_keys[id(row)] = key
+        if self.by_date and not isinstance(self.table, table_by_date):
+            for bucket in self.buckets.values():
+                bucket.sort(key=attrgetter('date'))
+
+    def invalidate(self):
+        self.buckets = None
+        self.row_keys = {}
+
+    def lookup(self, key):
+        r'''Returns a list of the rows with `key`.
+        '''
+        if self.buckets is None:
+            self.rebuild()
+        return list(self.buckets.get(key, ()))
+
+    def add(self, row):
+        if self.buckets is None:
+            return
+        key = self.get_key(row)
+        bucket = self.buckets.setdefault(key, [])
+        if self.by_date:
+            # after any other rows with the same date, like table_by_date.add_row
+            bucket.insert(bisect_right(bucket, row.date, key=attrgetter('date')), row)
+        else:
+            bucket.append(row)
+        self.row_keys[id(row)] = key
+
+    def remove(self, row):
+        key = self.row_keys.pop(id(row), None)
+        if key is None:
+            return
+        bucket = self.buckets[key]
+        for i, r in enumerate(bucket):
+            if r is row:
+                del bucket[i]
+                break
+        if not bucket:
+            del self.buckets[key]
+
+    def replace(self, old_row, new_row):
+        r'''new_row takes old_row's place in the table.
+        '''
+        key = self.row_keys.get(id(old_row))
+        if key is None:
+            return
+        if self.get_key(new_row) != key:
+            self.remove(old_row)
+            self.add(new_row)
+            return
+        bucket = self.buckets[key]
+        for i, r in enumerate(bucket):
+            if r is old_row:
+                bucket[i] = new_row
+                break
+        del self.row_keys[id(old_row)]
+        self.row_keys[id(new_row)] = key
+
+    def in_order(self, row, key):
+        r'''Returns True if row's date is still in order with the rows next to it in its bucket.
+        '''
+        bucket = self.buckets[key]
+        i = next(i for i, r in enumerate(bucket) if r is row)
+        return (i == 0 or bucket[i - 1].date <= row.date) and \
+               (i == len(bucket) - 1 or row.date <= bucket[i + 1].date)
+
+    def row_changed(self, row):
+        r'''Called when an indexed attr of row, or its date for by_date indexes, is set.
+        '''
+        key = self.row_keys.get(id(row))
+        if key is None:
+            return
+        if self.get_key(row) == key:
+            if not self.by_date or self.in_order(row, key):
+                return
+            self.remove(row)
+            self.add(row)
+        elif self.by_date:
+            self.remove(row)
+            self.add(row)
+        else:
+            # there's no cheap way to find row's place in the table order
+            self.invalidate()
+
+class Stock_index(Index):
+    r'''The Index on Inventory.item, plus a checkpoint of each item's stock, for Items.in_stock.
+
+    The checkpoint for an item is its last "count" or "estimate" row (these reset the stock, see
+    Inventory.resets in row.py), and the units, uncertainty after replaying the rows since then.  It is
+    figured when first asked for, by replaying the item's rows back to that row.  Then adding a row after
+    the checkpoint row (the usual case) just applies the row to the units, uncertainty, and adding a row
+    before it changes nothing.  Any other change to an item's rows drops its checkpoint, to be figured
+    again on the next stock call.  So stock is O(1) in the usual case, and otherwise O(rows since the
+    last count).
+
+    The checkpoints are also dropped when the Items or Products tables change, since total_units depends
+    on the pkg_size.
+    '''
+    Stock_attrs = ("code", "num_pkgs", "num_units", "uncertainty")
+
+    def __init__(self, table, attrs):
+        super().__init__(table, attrs)
+        self.checkpoints = {}     # {item: [reset row or None, units, uncertainty]}
+        self.tag = None           # versions of Items and Products when the checkpoints were figured
+
+    def watched_attrs(self):
+        return super().watched_attrs() + self.Stock_attrs
+
+    def stock(self, item):
+        r'''Returns units, uncertainty of item.
+        '''
+        self.check_tag()
+        return self.checkpoint(item)
+
+    def stock_levels(self, items):
+        r'''Returns {item: (units, uncertainty)} for items.
+        '''
+        self.check_tag()
+        return {item: self.checkpoint(item) for item in items}
+
+    def check_tag(self):
+        r'''Drops the checkpoints if Items or Products have changed since they were figured.
+        '''
+        if self.buckets is None:
+            self.rebuild()
+        database = get_database()
+        tag = tuple((table.version, table.row_class.changes) for table in (database.Items, database.Products))
+        if tag != self.tag:
+            self.checkpoints.clear()
+            self.tag = tag
+
+    def checkpoint(self, item):
+        checkpoint = self.checkpoints.get(item)
+        if checkpoint is None:
+            checkpoint = self.checkpoints[item] = self.replay(item)
+        return checkpoint[1], checkpoint[2]
+
+    def replay(self, item):
+        r'''Returns the checkpoint for item.
+        '''
+        bucket = self.buckets.get(item, ())
+        resets = self.table.row_class.resets
+        start = len(bucket) - 1
+        while start >= 0 and bucket[start].code not in resets:
+            start -= 1
+        units = uncertainty = 0
+        for inv in bucket[max(start, 0):]:
+            units, uncertainty = inv.apply_to(units, uncertainty)
+        return [bucket[start] if start >= 0 else None, units, uncertainty]
+
+    def rebuild(self):
+        super().rebuild()
+        self.checkpoints.clear()
+
+    def invalidate(self):
+        super().invalidate()
+        self.checkpoints.clear()
+
+    def add(self, row):
+        super().add(row)
+        checkpoint = self.checkpoints.get(self.row_keys.get(id(row)))
+        if checkpoint is None:
+            return
+        reset = checkpoint[0]
+        if reset is not None and row.date < reset.date:
+            return
+        # after the checkpoint row (add puts it after the rows with the same date)
+        if row.code in self.table.row_class.resets:
+            del self.checkpoints[row.item]
+        else:
+            checkpoint[1], checkpoint[2] = row.apply_to(checkpoint[1], checkpoint[2])
+
+    def remove(self, row):
+        self.checkpoints.pop(self.row_keys.get(id(row)), None)
+        super().remove(row)
+
+    def replace(self, old_row, new_row):
+        self.checkpoints.pop(self.row_keys.get(id(old_row)), None)
+        self.checkpoints.pop(self.get_key(new_row), None)
+        super().replace(old_row, new_row)
+
+    def row_changed(self, row):
+        self.checkpoints.pop(self.row_keys.get(id(row)), None)
+        self.checkpoints.pop(self.get_key(row), None)
+        super().row_changed(row)
+
 class base_table:
+    referenced = False    # True if other tables have foreign keys to this table (set below Tables)
+
     def __init__(self, row_class):
         self.row_class = row_class
+        self.indexes = {}     # {attrs: Index}
+        self.version = new_version()   # new_version() again whenever rows are added, replaced or deleted
 
     @property
     def name(self):
         return self.row_class.__name__
 
     def check_foreign_keys(self):
-        r'''Returns the number of errors found.
+        r'''Returns the number of relationships with errors found.
+        '''
+        errors = self.foreign_key_errors(list(self.values()))
+        for error in errors:
+            print(f"{self.name}.check_foreign_keys: {error}")
+        return len(errors)
+
+    def foreign_key_errors(self, rows):
+        r'''Returns a list of error messages, one per foreign key with keys in rows that aren't found.
+        '''
+        errors = []
+        for fk in foreign_keys_from(self.row_class):
+            missing = fk.missing(rows)
+            if missing:
+                errors.append(fk.error(rows, missing))
+        return errors
+
+    def constraint_errors(self, rows):
+        r'''Returns a list of error messages, one per constraint (see row.constraints) broken by rows.
+
+        Each column is checked for all of the rows at once.
         '''
-        errors = 0
-        for row_num, row in enumerate(self.values(), 1):
-            if not row.check_foreign_keys(row_num, False):
-                errors += 1
+        errors = []
+        for attr, getter, constraints in constraints_of(self.row_class):
+            values = list(map(getter, rows))
+            for constraint in constraints:
+                if not constraint.all_ok(values):
+                    bad = [(row_num, value) for row_num, value in enumerate(values, 1) if not constraint.ok(value)]
+                    if len(rows) == 1:
+                        errors.append(f"{self.name}.{attr}={bad[0][1]!r}: must be {constraint}")
+                    else:
+                        errors.append(f"{self.name}.{attr}: must be {constraint} (" +
+                                      ", ".join(f"row {row_num}={value!r}" for row_num, value in bad) + ")")
         return errors
 
+    def check_batch_constraints(self, rows):
+        r'''Raises ValueError if any of the rows break the constraints (see row.constraints).
+        '''
+        errors = self.constraint_errors(rows)
+        if errors:
+            raise ValueError(f"{self.name}.check_batch_constraints: " + "; ".join(errors))
+
+    def check_batch_foreign_keys(self, rows):
+        r'''Raises KeyError if any of the foreign keys in rows are not found.
+        '''
+        errors = self.foreign_key_errors(rows)
+        if errors:
+            raise KeyError(f"{self.name}.check_batch_foreign_keys: " + "; ".join(errors))
+
+    def create_index(self, *attrs, index_class=None):
+        r'''Returns the Index on attrs, creating it if needed.
+
+        index_class is a subclass of Index (e.g., Stock_index) to use instead, replacing a plain Index on
+        attrs.
+        '''
+        index_class = index_class or Index
+        index = self.indexes.get(attrs)
+        if not isinstance(index, index_class):
+            index = self.indexes[attrs] = index_class(self, attrs)
+            row_class = self.row_class
+            if 'indexes_on' not in vars(row_class):
+                row_class.indexes_on = {}
+            for attr in index.watched_attrs():
+                row_class.indexes_on.setdefault(attr, weakref.WeakSet()).add(index)
+        return index
+
+    def lookup(self, **attrs):
+        r'''Returns a list of the rows with these attr values, in table order.
+
+        Uses the index on these attrs (in any order), creating it if needed.
+        '''
+        names = tuple(attrs.keys())
+        index = self.indexes.get(names)
+        if index is None:
+            for index in self.indexes.values():
+                if sorted(index.attrs) == sorted(names):
+                    break
+            else:
+                index = self.create_index(*names)
+        key = tuple(attrs[name] for name in index.attrs)
+        if len(key) == 1:
+            key = key[0]
+        return index.lookup(key)
+
+    def index_add(self, row):
+        for index in self.indexes.values():
+            index.add(row)
+
+    def index_remove(self, row):
+        for index in self.indexes.values():
+            index.remove(row)
+
+    def index_replace(self, old_row, new_row):
+        for index in self.indexes.values():
+            index.replace(old_row, new_row)
+
+    def invalidate_indexes(self):
+        for index in self.indexes.values():
+            index.invalidate()
+
     def insert(self, **attrs):
         self.add_row(self.row_class(**attrs))
 
@@ -43,7 +488,8 @@ class base_table:
         self.add_row(self.row_class.from_csv(header, row, ignore_unknown_cols=ignore_unknown_cols),
                      skip_fk_check=skip_fk_check)
 
-    def from_csv(self, csv_reader, from_scratch=True, ignore_unknown_cols=False, skip_fk_check=False):
+    def from_csv(self, csv_reader, from_scratch=True, ignore_unknown_cols=False, skip_fk_check=False,
+                 filename=None):
         r'''Loads rows from csv_reader.  First row is header row that identifies the attrs.
 
         If from_scratch is False, appends the rows to the current contents; otherwise it replaces
@@ -51,16 +497,9 @@ class base_table:
         '''
         if from_scratch:
             self.clear()
-        header = next(csv_reader)
-        try:
-            while True:
-                row = next(csv_reader)
-                if len(row) == 0:
-                    break
-                self.insert_from_csv(header, row, ignore_unknown_cols=ignore_unknown_cols,
-                                     skip_fk_check=skip_fk_check)
-        except StopIteration:
-            pass
+        rows = list(typed_rows(csv_reader, self.row_class, ignore_unknown_cols=ignore_unknown_cols,
+                               filename=filename))
+        self.insert_many(rows, skip_fk_check=skip_fk_check)
 
     def to_csv(self, file, add_table_name=True, add_empty_row=False):
         r'''Writes itself in database csv format to file.
@@ -112,13 +551,111 @@ class table_unique(base_table, dict):
         base_table.__init__(self, row_class)
         dict.__init__(self)
 
+    def __setitem__(self, key, row):
+        self.version = new_version()
+        if self.referenced and key in self:
+            references_changed(self.name)
+        if self.indexes:
+            old_row = self.get(key)
+            dict.__setitem__(self, key, row)
+            if old_row is None:
+                self.index_add(row)
+            else:
+                self.index_replace(old_row, row)
+        else:
+            dict.__setitem__(self, key, row)
+
+    def __delitem__(self, key):
+        self.version = new_version()
+        if self.referenced:
+            references_changed(self.name)
+        if self.indexes:
+            self.index_remove(self[key])
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        dict.clear(self)
+        self.version = new_version()
+        self.invalidate_indexes()
+        references_changed(self.name)
+
     def add_row(self, row, skip_fk_check=False):
         key = row.key()
+        self.check_batch_constraints((row,))
         if not skip_fk_check:
-            row.check_foreign_keys(key, raise_exc=True)
+            self.check_batch_foreign_keys((row,))
         assert key not in self, f"{self.name}.insert: Duplicate {key=}"
         self[key] = row
 
+    def insert_many(self, rows, skip_fk_check=False):
+        r'''Adds all of the rows.  The constraints and foreign keys are checked once for the whole batch.
+        '''
+        self.check_batch_constraints(rows)
+        if not skip_fk_check:
+            self.check_batch_foreign_keys(rows)
+        for row in rows:
+            key = row.key()
+            assert key not in self, f"{self.name}.insert: Duplicate {key=}"
+            self[key] = row
+
+    def clone(self):
+        r'''Returns a new table sharing the same rows.
+        '''
+        ans = self.__class__(self.row_class)
+        ans.referenced = self.referenced
+        dict.update(ans, self)
+        return ans
+
+    def rekey(self):
+        r'''Rebuilds the keys after primary key attrs of rows have been set, keeping the row order.
+        '''
+        rows = list(self.values())
+        dict.clear(self)
+        for row in rows:
+            key = row.key()
+            assert key not in self, f"{self.name}.rekey: Duplicate {key=}"
+            dict.__setitem__(self, key, row)
+        self.version = new_version()
+        references_changed(self.name)
+
+    def remove_rows(self, rows):
+        r'''Removes rows (these same objects) in one pass, keeping the order of the other rows.
+        '''
+        ids = set(map(id, rows))
+        keep = [(key, row) for key, row in self.items() if id(row) not in ids]
+        dict.clear(self)
+        dict.update(self, keep)
+        self.version = new_version()
+        self.invalidate_indexes()
+        references_changed(self.name)
+
+    def replace_rows(self, table):
+        r'''Replaces the rows in this table with the rows in `table`.
+        '''
+        dict.clear(self)
+        dict.update(self, table)
+        self.version = new_version()
+        self.invalidate_indexes()
+        references_changed(self.name)
+
+class Inventory(table_unique):
+    def stock(self, item):
+        r'''Returns units, uncertainty of item in stock (see Stock_index).
+        '''
+        return self.create_index('item', index_class=Stock_index).stock(item)
+
+    def stock_levels(self, items=None):
+        r'''Returns {item: (units, uncertainty)} for items (default all of the Items), the same as
+        Items.in_stock.
+
+        This is a dict rather than arrays, since numpy isn't a dependency.  The levels come from the
+        Stock_index checkpoints, so this is O(1) per item once they are figured, and otherwise replays
+        each item's rows since its last "count" or "estimate", in date order from its index bucket.
+        '''
+        if items is None:
+            items = get_database().Items.keys()
+        return self.create_index('item', index_class=Stock_index).stock_levels(items)
+
 class Months(table_unique):
     @staticmethod
     def inc_month(year, month):
@@ -158,12 +695,11 @@ class Months(table_unique):
         return self[year, month]
 
     def by_month(self, month):
-        r'''Generates all rows with this month.
+        r'''Returns all rows with this month.
         '''
-        for row in self.values():
-            if row.month == month:
-                yield row
+        return self.lookup(month=month)
 
+    @cached(table_method=True)
     def avg(self, month, attr):
         rows = [row for row in self.by_month(month) if getattr(row, attr) is not None]
         if not rows:
@@ -182,20 +718,161 @@ class Months(table_unique):
     def avg_meals_served(self, month):
         return self.avg(month, 'meals_served')
 
-class table_by_date(base_table, list):
-    def __init__(self, row_class):
-        base_table.__init__(self, row_class)
-        list.__init__(self)
+class block_list:
+    r'''A list of rows kept in blocks of about Block_size rows.
 
-    def first_date(self, date):
-        r'''Returns index to the first date == `date`.
+    If the rows have dates, they are kept in date order, and `maxes` (the last date in each block) is a
+    top level index over the blocks.  Finding a date is then a bisect on maxes and a bisect within one
+    block, and inserting a row only shifts the rows after it in its block.
+
+    Supports len, iteration, reversed, and indexing and slicing (returning a list) like a list.
+    '''
+    Block_size = 300    # blocks are split in half when they reach twice this
+
+    def __init__(self, dated):
+        self.dated = dated
+        self.rebuild([])
+
+    def rebuild(self, rows):
+        r'''Replaces all of the rows in this list with `rows` (which must already be in date order).
         '''
-        return self.find_date(date, find_first=True)
+        size = self.Block_size
+        self.blocks = [rows[i: i + size] for i in range(0, len(rows), size)]
+        self.reindex()
 
-    def last_date(self, date):
-        r'''Returns index to smallest date > `date`.
+    def reindex(self, start=0):
+        r'''Recomputes the offsets (index of the first row in each block), and maxes from block start on.
         '''
-        return self.find_date(date, find_first=False)
+        if start == 0:
+            self.offsets = []
+            self.maxes = []
+            offset = 0
+        else:
+            del self.offsets[start:]
+            del self.maxes[start:]
+            offset = self.offsets[-1] + len(self.blocks[start - 1])
+        for block in self.blocks[start:]:
+            self.offsets.append(offset)
+            offset += len(block)
+            if self.dated:
+                self.maxes.append(block[-1].date)
+        self.length = offset
+
+    def clear(self):
+        self.rebuild([])
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __reversed__(self):
+        for block in reversed(self.blocks):
+            yield from reversed(block)
+
+    def locate(self, index):
+        r'''Returns block number, index within that block.
+        '''
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f"{self.__class__.__name__} index {index} out of range")
+        b = bisect_right(self.offsets, index) - 1
+        return b, index - self.offsets[b]
+
+    def irange(self, start, stop, reverse=False):
+        r'''Generates the rows from index start up to (but not including) index stop.
+
+        If reverse is True, the rows are generated from stop - 1 down to start.
+        '''
+        stop = min(stop, self.length)
+        if start >= stop:
+            return
+        if reverse:
+            b, i = self.locate(stop - 1)
+            remaining = stop - start
+            while remaining:
+                block = self.blocks[b]
+                for j in range(i, max(i - remaining, -1), -1):
+                    yield block[j]
+                remaining -= min(i + 1, remaining)
+                b -= 1
+                i = len(self.blocks[b]) - 1
+            return
+        b, i = self.locate(start)
+        remaining = stop - start
+        for block in islice(self.blocks, b, None):
+            n = min(len(block) - i, remaining)
+            yield from islice(block, i, i + n)
+            remaining -= n
+            if not remaining:
+                return
+            i = 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1:
+                return list(islice(self, start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        b, i = self.locate(index)
+        return self.blocks[b][i]
+
+    def __setitem__(self, index, row):
+        r'''Replaces one row.  The new row must have the same date.
+        '''
+        b, i = self.locate(index)
+        block = self.blocks[b]
+        if self.dated:
+            assert row.date == block[i].date, \
+                   f"{self.__class__.__name__}[{index}]: new date {row.date} != {block[i].date}"
+        block[i] = row
+
+    def __delitem__(self, index):
+        b, i = self.locate(index)
+        block = self.blocks[b]
+        del block[i]
+        if not block:
+            del self.blocks[b]
+        self.reindex(b)
+
+    def insert_at(self, index, row):
+        r'''Inserts row before index.  The caller must keep the rows in date order.
+        '''
+        if not self.blocks:
+            self.blocks.append([row])
+            self.reindex()
+            return
+        if index >= self.length:
+            b = len(self.blocks) - 1
+            i = len(self.blocks[b])
+        else:
+            b, i = self.locate(index)
+        block = self.blocks[b]
+        block.insert(i, row)
+        if len(block) >= 2 * self.Block_size:
+            half = len(block) // 2
+            self.blocks[b: b + 1] = [block[:half], block[half:]]
+        self.reindex(b)
+
+    def append(self, row):
+        self.insert_at(self.length, row)
+
+    def extend(self, rows):
+        r'''Appends rows, filling the last block first.
+        '''
+        if not rows:
+            return
+        start = max(len(self.blocks) - 1, 0)
+        if self.blocks and len(self.blocks[-1]) < self.Block_size:
+            room = self.Block_size - len(self.blocks[-1])
+            self.blocks[-1].extend(rows[:room])
+            rows = rows[room:]
+        size = self.Block_size
+        self.blocks.extend(rows[i: i + size] for i in range(0, len(rows), size))
+        self.reindex(start)
 
     def find_date(self, date, find_first):
         r'''This returns the index at which to insert `date`.
@@ -210,63 +887,361 @@ class table_by_date(base_table, list):
         the index returned is just after the last matching date.  It also means that the index returned
         may equal length of the file, meaning that it does not point to any row in the file.
         '''
-        first = 0              # ignore < first
-        last = len(self)       # ignore >= last
-        while first < last:
-            i = (last + first) // 2  # might be first, but never last
-            if date < self[i].date:
-                last = i
-            elif date > self[i].date:
-                first = i + 1
-            elif find_first:
-                last = i
-            else:
-                first = i + 1
-        # first == last
-        return first
+        bisect = bisect_left if find_first else bisect_right
+        b = bisect(self.maxes, date)
+        if b == len(self.blocks):
+            return self.length
+        return self.offsets[b] + bisect(self.blocks[b], date, key=attrgetter('date'))
+
+class table_by_date(base_table, block_list):
+    def __init__(self, row_class):
+        base_table.__init__(self, row_class)
+        block_list.__init__(self, 'date' in row_class.types)
+
+    def rebuild(self, rows):
+        block_list.rebuild(self, rows)
+        self.version = new_version()
+        self.invalidate_indexes()
+
+    def extend(self, rows):
+        block_list.extend(self, rows)
+        self.version = new_version()
+        for row in rows:
+            self.index_add(row)
+
+    def insert_at(self, index, row):
+        block_list.insert_at(self, index, row)
+        self.version = new_version()
+        self.index_add(row)
+
+    def __setitem__(self, index, row):
+        old_row = self[index]
+        block_list.__setitem__(self, index, row)
+        self.version = new_version()
+        self.index_replace(old_row, row)
+
+    def __delitem__(self, index):
+        self.index_remove(self[index])
+        block_list.__delitem__(self, index)
+        self.version = new_version()
+
+    def remove_rows(self, rows):
+        r'''Removes rows (these same objects) in one pass, keeping the order of the other rows.
+        '''
+        ids = set(map(id, rows))
+        self.rebuild([row for row in self if id(row) not in ids])
+
+    def index_of(self, row):
+        r'''Returns the index of row (the same object) in the table.
+        '''
+        for i in range(self.first_date(row.date), self.last_date(row.date)):
+            if self[i] is row:
+                return i
+        raise ValueError(f"{self.name}.index_of: row not in table")
+
+    def between(self, start_date, end_date):
+        r'''Returns a view (see date_view) of the rows with start_date <= date <= end_date.
+
+        Either date may be None, for no limit.
+        '''
+        if start_date is not None:
+            start_date = parse_date(start_date)
+        if end_date is not None:
+            end_date = parse_date(end_date)
+        return date_view(self, start_date, end_date)
+
+    def since(self, date):
+        r'''Returns a view (see date_view) of the rows with date >= `date`.
+        '''
+        return date_view(self, parse_date(date))
+
+    def first_date(self, date):
+        r'''Returns index to the first date == `date`.
+        '''
+        return self.find_date(date, find_first=True)
+
+    def last_date(self, date):
+        r'''Returns index to smallest date > `date`.
+        '''
+        return self.find_date(date, find_first=False)
 
     def add_row(self, row, skip_fk_check=False):
+        self.check_batch_constraints((row,))
         if hasattr(row, 'date'):
             i = self.last_date(row.date)
            #print(f"{self.name}.add_row(date={row.date}), inserted at {i=}")
-            list.insert(self, i, row)
             if not skip_fk_check:
-                row.check_foreign_keys(row.date, raise_exc=True)
+                self.check_batch_foreign_keys((row,))
+            self.insert_at(i, row)
         else:
             if not skip_fk_check:
-                row.check_foreign_keys(len(self) + 1, raise_exc=True)
+                self.check_batch_foreign_keys((row,))
             self.append(row)
-    
+
+    def insert_many(self, rows, skip_fk_check=False):
+        r'''Adds all of the rows, keeping the table in date order.
+
+        Rows with the same date end up in the order given, after any rows already in the table with that
+        date (the same as calling add_row for each row).
+
+        If the rows are already in date order, starting on or after the last date in the table, they are
+        simply appended.  Otherwise the table is sorted once.  Python's sort is stable and merges runs, so
+        this is still linear when the new rows are in order.
+
+        The constraints and foreign keys are checked once for the whole batch.
+        '''
+        rows = list(rows)
+        self.check_batch_constraints(rows)
+        if not skip_fk_check:
+            self.check_batch_foreign_keys(rows)
+        if not rows:
+            return
+        if not self.dated:
+            self.extend(rows)
+        elif self.in_order(rows, self.maxes[-1] if self.maxes else None):
+            self.extend(rows)
+        else:
+            all_rows = list(self)
+            all_rows.extend(rows)
+            all_rows.sort(key=attrgetter('date'))
+            self.rebuild(all_rows)
+
+    @staticmethod
+    def in_order(rows, prev_date=None):
+        r'''Returns True if the rows are in date order, all on or after prev_date (if not None).
+        '''
+        for row in rows:
+            if prev_date is not None and row.date < prev_date:
+                return False
+            prev_date = row.date
+        return True
+
     def values(self):
         return self
 
+    def clone(self):
+        r'''Returns a new table sharing the same rows.
+        '''
+        ans = self.__class__(self.row_class)
+        ans.referenced = self.referenced
+        ans.rebuild(list(self))
+        return ans
+
+    def replace_rows(self, table):
+        r'''Replaces the rows in this table with the rows in `table`.
+        '''
+        self.rebuild(list(table))
+
+class date_view:
+    r'''A view of the rows in a table_by_date with start <= date <= end (either may be None).
+
+    The view doesn't hold any rows.  The range is found (by bisect) each time the view is used, so it stays
+    valid as rows are added to (or deleted from) the table.  where returns a narrower view.
+    '''
+    def __init__(self, table, start=None, end=None, predicates=()):
+        self.table = table
+        self.start = start
+        self.end = end
+        self.predicates = predicates
+
+    def bounds(self):
+        r'''Returns the index of the first row in the view, and the index just past the last row.
+        '''
+        first = 0 if self.start is None else self.table.first_date(self.start)
+        last = len(self.table) if self.end is None else self.table.last_date(self.end)
+        return first, max(first, last)
+
+    def rows(self, reverse=False):
+        rows = self.table.irange(*self.bounds(), reverse=reverse)
+        if not self.predicates:
+            return rows
+        return (row for row in rows if all(predicate(row) for predicate in self.predicates))
+
+    def __iter__(self):
+        return self.rows()
+
+    def __reversed__(self):
+        return self.rows(reverse=True)
+
+    def __len__(self):
+        if not self.predicates:
+            first, last = self.bounds()
+            return last - first
+        return sum(1 for _ in self)
+
+    def __bool__(self):
+        return any(True for _ in self)
+
+    def where(self, *predicates, **equals):
+        r'''Returns a view of the rows in this view that pass all of the predicates (functions taking a
+        row), and have all of the name=value equals.
+        '''
+        predicates = self.predicates + predicates
+        if equals:
+            get_values = attrgetter(*equals.keys())
+            values = tuple(equals.values()) if len(equals) > 1 else next(iter(equals.values()))
+            predicates += (lambda row: get_values(row) == values,)
+        return date_view(self.table, self.start, self.end, predicates)
+
+    def first(self):
+        r'''Returns the first row in the view, or None.
+        '''
+        return next(iter(self), None)
+
+    def last(self):
+        r'''Returns the last row in the view, or None.
+        '''
+        return next(reversed(self), None)
+
 def table_for_row(row_class):
     if row_class.table_name == "Months":
         return Months(row_class)
+    if row_class.table_name == "Inventory":
+        return Inventory(row_class)
     if row_class.primary_key is not None or row_class.primary_keys is not None:
         return table_unique(row_class)
     return table_by_date(row_class)
 
 Tables = {row_class.table_name: table_for_row(row_class) for row_class in Rows}
 
+for row_class in Rows:
+    for table_name in row_class.foreign_keys:
+        Tables[table_name].referenced = True
+
 class DB:
     def __init__(self, tables):
         for name, table in tables.items():
             setattr(self, name, table)
 
+    def as_of(self, date):
+        r'''Returns the stock levels and cash balances as of the end of `date` (see as_of.py).
+        '''
+        from as_of import As_of
+        return As_of(self, date)
+
+    def fork(self):
+        return Fork(self)
+
+class Fork:
+    r'''A copy-on-write fork of the database (or of another Fork), for "what if" evaluation.
+
+    The fork shares the parent's tables and rows until they are changed through the fork with insert,
+    update, delete, row_for_update or table_for_update.  Changed tables are cloned (sharing their rows)
+    and changed rows are copied, so the parent is never touched.
+
+    Use "with fork:" while evaluating, so that the calculated columns and methods like Items.order_stats
+    see the fork's tables.  When done, either drop the fork or merge() its changes into the parent.
+
+    The foreign keys are checked once, by merge().
+    '''
+    def __init__(self, parent):
+        self.parent = parent
+        self.tables = {}          # {table_name: table}, the tables changed in this fork
+        self.owned_rows = {}      # {table_name: set of rows}, the rows copied (or inserted) in this fork
+        self.saved_databases = []
+
+    def __getattr__(self, name):
+        r'''Tables that haven't been changed come from the parent.
+        '''
+        if name in self.tables:
+            return self.tables[name]
+        return getattr(self.parent, name)
+
+    def __enter__(self):
+        self.saved_databases.append(get_database())
+        set_database(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        set_database(self.saved_databases.pop())
+        return False
+
+    def fork(self):
+        return Fork(self)
+
+    def table_for_update(self, table_name):
+        if table_name not in self.tables:
+            self.tables[table_name] = getattr(self.parent, table_name).clone()
+            self.owned_rows[table_name] = set()
+        return self.tables[table_name]
+
+    def row_for_update(self, table_name, key):
+        r'''Returns this fork's own copy of the row at key (an index for date ordered tables).
+        '''
+        table = self.table_for_update(table_name)
+        row = table[key]
+        if row not in self.owned_rows[table_name]:
+            row = copy.copy(row)
+            table[key] = row
+            self.owned_rows[table_name].add(row)
+        return row
+
+    def insert(self, table_name, **attrs):
+        table = self.table_for_update(table_name)
+        row = table.row_class(**attrs)
+        table.add_row(row, skip_fk_check=True)
+        self.owned_rows[table_name].add(row)
+        return row
+
+    def update(self, table_name, key, **attrs):
+        row = self.row_for_update(table_name, key)
+        for name, value in attrs.items():
+            setattr(row, name, row.types[name](value))
+        return row
+
+    def delete(self, table_name, key):
+        del self.table_for_update(table_name)[key]
+
+    def merge(self):
+        r'''Replaces the parent's versions of the tables changed in this fork with this fork's versions.
+
+        The fork is empty afterwards.  Raises ValueError, leaving the parent unchanged, if any of the changed
+        rows break their constraints, or KeyError if any of the foreign keys to or from the changed tables
+        are missing.
+        '''
+        for table_name, rows in self.owned_rows.items():
+            self.tables[table_name].check_batch_constraints(list(rows))
+        errors = foreign_key_errors(self, self.tables.keys())
+        if errors:
+            raise KeyError("Fork.merge: " + "; ".join(errors))
+        for table_name, table in self.tables.items():
+            if isinstance(self.parent, Fork):
+                self.parent.tables[table_name] = table
+                self.parent.owned_rows.setdefault(table_name, set()).update(self.owned_rows[table_name])
+            else:
+                getattr(self.parent, table_name).replace_rows(table)
+        self.tables.clear()
+        self.owned_rows.clear()
+
 Database = DB(Tables)
 
 set_database(Database)
 
 
-__all__ = "CheckInventory Decimal date datetime timedelta bills abbr_month Tables Database " \
+__all__ = "CheckInventory Decimal date datetime timedelta bills abbr_month Tables Database get_database " \
           "load_database save_database load_csv load_all clear_all check_foreign_keys " \
+          "read_side_file load_side_file total_starts cache_stats " \
           "CSV_dialect CSV_format".split()
 
 
-def load_database(csv_filename=Database_filename, ignore_unknown_cols=False):
+def load_database(csv_filename=Database_filename, ignore_unknown_cols=False, tables=None,
+                  skip_fk_check=False):
     r'''Loads the database tables.
+
+    `tables` lists the names of the tables that the caller needs.  In low-resource mode (see README),
+    only these tables, and the tables they reference, are loaded.  The other tables are copied unchanged
+    from csv_filename by save_database.  Otherwise all tables are loaded.
+
+    The foreign keys are checked once all of the tables are loaded.  Raises KeyError if any are missing.
     '''
+    if Max_memory_mb:
+        set_memory_limit(int(Max_memory_mb))
+    if tables is not None and Low_resource:
+        needed = table_closure(tables)
+    else:
+        needed = None
+    Skipped_tables.clear()
+    Loaded_tables.clear()
     with open(csv_filename, 'r') as f:
         reader = iter(csv.reader(f, CSV_dialect, **CSV_format))
         ans = {}
@@ -274,22 +1249,135 @@ def load_database(csv_filename=Database_filename, ignore_unknown_cols=False):
             try:
                 header = next(reader)
                 assert len(header) == 1, f"from_csv: Expected table name, got {row=}"
-                ans[header[0].strip()] = \
-                  Tables[header[0].strip()].from_csv(reader, ignore_unknown_cols=ignore_unknown_cols,
-                                                     skip_fk_check=True)
+                table_name = header[0].strip()
+                if needed is not None and table_name not in needed:
+                    skip_table(reader)
+                    Skipped_tables.add(table_name)
+                else:
+                    ans[table_name] = \
+                      Tables[table_name].from_csv(reader, ignore_unknown_cols=ignore_unknown_cols,
+                                                  skip_fk_check=True, filename=csv_filename)
             except StopIteration:
                 break
+    if not skip_fk_check:
+        errors = foreign_key_errors(Database, ans.keys())
+        if errors:
+            raise KeyError("load_database: " + "; ".join(errors))
+    record_loaded(csv_filename, ans.keys())
     return ans
 
+def record_loaded(csv_filename, table_names):
+    r'''Records the current versions of table_names in Loaded_tables, as matching csv_filename.
+    '''
+    stat = os.stat(csv_filename)
+    file_stamp = os.path.abspath(csv_filename), stat.st_mtime_ns, stat.st_size
+    for table_name in table_names:
+        table = Tables[table_name]
+        Loaded_tables[table_name] = file_stamp, table.version, table.row_class.changes
+
+def skip_table(csv_reader):
+    for row in csv_reader:
+        if len(row) == 0:
+            break
+
+def table_closure(table_names):
+    r'''Returns the set of table names needed to use table_names.
+
+    This includes the tables that they reference through foreign_keys or uses_tables.
+    '''
+    ans = set()
+    todo = list(table_names)
+    while todo:
+        name = todo.pop()
+        if name not in ans:
+            ans.add(name)
+            row_class = Tables[name].row_class
+            todo.extend(row_class.foreign_keys)
+            todo.extend(row_class.uses_tables)
+    return ans
+
+def set_memory_limit(megabytes):
+    r'''Caps the address space of this process, so that running out of memory raises MemoryError.
+    '''
+    import resource
+
+    limit = megabytes * 1024 * 1024
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY and limit > hard:
+        limit = hard
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def database_changed(csv_filename=Database_filename):
+    r'''Returns True if csv_filename has been written (e.g., by another script) since this process last
+    loaded or saved it.
+    '''
+    stat = os.stat(csv_filename)
+    file_stamp = os.path.abspath(csv_filename), stat.st_mtime_ns, stat.st_size
+    return any(info[0] != file_stamp for info in Loaded_tables.values())
+
+def changed_constraint_errors():
+    r'''Returns a list of error messages for the constraints (see row.constraints) broken by rows changed
+    in place since load_database.
+
+    Inserted rows are checked by insert, so only the tables with rows set since the load are checked.
+    '''
+    errors = []
+    for table_name, (_, _, changes) in Loaded_tables.items():
+        table = Tables[table_name]
+        if table.row_class.changes != changes:
+            errors.extend(table.constraint_errors(list(table.values())))
+    return errors
+
 def save_database(csv_filename=Database_filename):
+    r'''Writes the database to csv_filename, keeping the old file as <name>-save.csv.
+
+    Raises ValueError, without writing anything, if rows changed in place break their constraints.
+    '''
+    errors = changed_constraint_errors()
+    if errors:
+        raise ValueError("save_database: " + "; ".join(errors))
     temp_filename = csv_filename[:-4] + '-new.csv'
     with open(temp_filename, 'w') as f:
-        for table in Tables.values():
-            if table.row_class.in_database:
-                table.to_csv(f, add_empty_row=True)
+        if Skipped_tables:
+            with open(csv_filename, 'r') as old_file:
+                write_tables(f, old_file)
+        else:
+            write_tables(f)
     save_filename = csv_filename[:-4] + '-save.csv'
     os.replace(csv_filename, save_filename)
     os.rename(temp_filename, csv_filename)
+    record_loaded(csv_filename, list(Loaded_tables.keys()))
+
+def write_tables(f, old_file=None):
+    r'''Writes all of the database tables to f.
+
+    If old_file is given, the tables in Skipped_tables are copied line by line from old_file, and the
+    tables are written in the order that they appear in old_file.
+    '''
+    written = set()
+    if old_file is not None:
+        lines = iter(old_file)
+        for line in lines:
+            table_name = line.strip()
+            if not table_name:
+                continue
+            if table_name in Skipped_tables:
+                f.write(line)
+                for line in lines:
+                    f.write(line)
+                    if not line.strip():
+                        break
+            else:
+                for line in lines:
+                    if not line.strip():
+                        break
+                table = Tables[table_name]
+                if table.row_class.in_database:
+                    table.to_csv(f, add_empty_row=True)
+            written.add(table_name)
+    for table in Tables.values():
+        if table.name not in written and table.row_class.in_database:
+            table.to_csv(f, add_empty_row=True)
 
 def load_csv(csv_filename, from_scratch=True, ignore_unknown_cols=False):
     r'''Loads table from csv_filename.
@@ -305,7 +1393,154 @@ def load_csv(csv_filename, from_scratch=True, ignore_unknown_cols=False):
         row1 = next(csv_reader)
         assert len(row1) == 1, f"load_csv: Expected table name, got {row1=}"
         table_name = row1[0].strip()
-        Tables[table_name].from_csv(csv_reader, from_scratch=from_scratch, ignore_unknown_cols=ignore_unknown_cols)
+        Tables[table_name].from_csv(csv_reader, from_scratch=from_scratch, ignore_unknown_cols=ignore_unknown_cols,
+                                    filename=csv_filename)
+
+def header_columns(row_class, header, ignore_unknown_cols=False, where=None):
+    r'''Returns [(name, converter) or None (for ignored columns)] for the names in header.
+    '''
+    where = where or row_class.table_name
+    columns = []
+    seen = set()
+    for name in header:
+        name = name.strip().lower()
+        if name not in row_class.types:
+            assert ignore_unknown_cols, f"{where}: unknown column {name!r} for {row_class.table_name}"
+            columns.append(None)
+        else:
+            assert name not in seen, f"{where}: duplicate column {name!r}"
+            seen.add(name)
+            columns.append((name, row_class.types[name]))
+    return columns
+
+def typed_rows(csv_reader, row_class, header=None, extra=None, ignore_unknown_cols=False, filename=None):
+    r'''Generates new rows of row_class from csv_reader, stopping at an empty line or the end of the file.
+
+    If header is None, the next line is the header.  The header is checked once, and a converter found for
+    each column.  `extra` is {name: value} set in every row (e.g., date and code for Inventory).
+
+    Empty values are not set, so that they have their default values.  Errors in a line raise ValueError
+    with the file, line number and column.
+    '''
+    if header is None:
+        header = next(csv_reader)
+    where = filename or row_class.table_name
+    columns = header_columns(row_class, header, ignore_unknown_cols, where)
+    extra = {name: row_class.types[name](value) for name, value in (extra or {}).items()}
+    names = {column[0] for column in columns if column is not None}.union(extra.keys())
+    missing = row_class.required.difference(names)
+    assert not missing, f"{where}: missing required columns {sorted(missing)}"
+    required = tuple(row_class.required)
+    num_columns = len(columns)
+    from_typed = row_class.from_typed
+    for row in csv_reader:
+        if len(row) == 0:
+            break
+        if len(row) != num_columns:
+            raise ValueError(f"{where}, line {csv_reader.line_num}: {len(row)} columns, expected {num_columns}")
+        attrs = extra.copy()
+        for column, value in zip(columns, row):
+            if column is not None:
+                value = value.strip()
+                if value:
+                    name, convert = column
+                    try:
+                        attrs[name] = convert(value)
+                    except (ValueError, TypeError) as e:
+                        raise ValueError(f"{where}, line {csv_reader.line_num}: {name}={value!r}: {e}") from None
+                    except ArithmeticError:   # decimal.InvalidOperation
+                        raise ValueError(f"{where}, line {csv_reader.line_num}: {name}={value!r}: "
+                                         f"not a valid {convert.__name__}") from None
+        for name in required:
+            if name not in attrs:
+                raise ValueError(f"{where}, line {csv_reader.line_num}: {name} is required")
+        yield from_typed(attrs)
+
+def read_side_file(csv_filename, row_class=None, extra=None, ignore_unknown_cols=False):
+    r'''Generates new rows from a side file, like Orders.csv, Reconcile.csv or Inv-checklist.csv.
+
+    The file may start with a table name line, which must match row_class (and is used as the row_class
+    if that's None).  See typed_rows for the rest.
+    '''
+    with open(csv_filename, 'r') as f:
+        csv_reader = csv.reader(f, CSV_dialect, **CSV_format)
+        row_class, header = side_file_header(csv_reader, row_class, csv_filename)
+        yield from typed_rows(csv_reader, row_class, header, extra, ignore_unknown_cols, csv_filename)
+
+def side_file_header(csv_reader, row_class, csv_filename):
+    r'''Reads the optional table name line and the header line of a side file.  Returns row_class, header.
+    '''
+    header = next(csv_reader)
+    if len(header) == 1 and header[0].strip() in Tables:
+        table_name = header[0].strip()
+        if row_class is None:
+            row_class = Tables[table_name].row_class
+        assert table_name == row_class.table_name, \
+               f"{csv_filename}: expected table {row_class.table_name}, got {table_name}"
+        header = next(csv_reader)
+    assert row_class is not None, f"{csv_filename}: no table name line, and no row_class given"
+    return row_class, header
+
+def import_hashes(rows, salt='', seen=None):
+    r'''Generates row, hash for each of rows.  The hashes are stored in the Imports table.
+
+    The hash covers the table name, salt, the row's values, and how many identical rows came before it in
+    rows, so that identical rows in one file are each imported once.  Pass the same `seen` dict to
+    continue counting across calls for the same file.
+    '''
+    if seen is None:
+        seen = {}     # {content: count}
+    for row in rows:
+        content = "|".join([row.table_name, salt] + [row.csv_value(name) for name in row.types])
+        seen[content] = count = seen.get(content, 0) + 1
+        yield row, hashlib.sha1(f"{content}|{count}".encode()).hexdigest()[:Import_hash_len]
+
+def skip_imported(rows, salt='', where=None):
+    r'''Generates the rows that haven't been imported before, and records them in the Imports table.
+
+    Prints how many rows were skipped.
+    '''
+    imports = get_database().Imports
+    assert "Imports" not in Skipped_tables, "skip_imported: the Imports table was not loaded"
+    today = date.today()
+    skipped = 0
+    for row, hash in import_hashes(rows, salt):
+        if hash in imports:
+            skipped += 1
+        else:
+            imports.insert(hash=hash, table_name=row.table_name, date=today)
+            yield row
+    if skipped:
+        print(f"{where or 'skip_imported'}: skipped {skipped} rows that were already imported")
+
+def load_side_file(csv_filename, table, from_scratch=False, extra=None, ignore_unknown_cols=False,
+                   batch_size=None, once=False, salt=''):
+    r'''Adds the rows in a side file (see read_side_file) to table, batch_size rows at a time.
+
+    If once is True, rows that have already been imported (with the same salt) are skipped (see
+    skip_imported).
+
+    Returns the number of rows added.
+    '''
+    if batch_size is None:
+        batch_size = Batch_size
+    if from_scratch:
+        table.clear()
+    rows = read_side_file(csv_filename, table.row_class, extra, ignore_unknown_cols)
+    if once:
+        rows = skip_imported(rows, salt, csv_filename)
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            table.insert_many(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        table.insert_many(batch)
+        count += len(batch)
+    return count
 
 def load_all(from_scratch=True, ignore_unknown_cols=False):
     for table in Tables.values():
@@ -320,11 +1555,11 @@ def clear_all():
         table.clear()
 
 def check_foreign_keys():
-    errors = 0
-    for table in Tables.values():
-        errors += table.check_foreign_keys()
+    errors = foreign_key_errors(Database)
+    for error in errors:
+        print(error)
     if errors:
-        print("Total errors:", errors)
+        print("Total errors:", len(errors))
     else:
         print("No errors found")
 
@@ -346,7 +1581,7 @@ def run():
         # create empty database csv file.
         clear_all()
     else:
-        load_database(ignore_unknown_cols=args.ignore_unknown_cols)
+        load_database(ignore_unknown_cols=args.ignore_unknown_cols, skip_fk_check=args.check_foreign_keys)
     if args.load_all:
         load_all(from_scratch=True, ignore_unknown_cols=args.ignore_unknown_cols)
     elif args.load is not None:
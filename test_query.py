@@ -0,0 +1,31 @@
+# test_query.py
+
+r'''Run with "python -m pytest test_*.py".  These load beans.csv.
+'''
+
+from datetime import date
+
+import pytest
+
+from table import load_database, Database
+from query import Query
+
+
+@pytest.fixture
+def database():
+    load_database()
+    return Database
+
+
+def test_where_calculated_date(database):
+    start = date(2025, 11, 1)
+    expected = sorted(month.meeting_date for month in database.Months.values() if month.meeting_date >= start)
+    got = [meeting_date for meeting_date, in Query(database.Months).where("meeting_date>=Nov 01, 25")
+                                                                    .select("meeting_date")
+                                                                    .order_by("~meeting_date")]
+    assert expected, "no Months meetings on or after Nov 01, 25 in beans.csv"
+    assert got == expected[::-1], f"{got=}, expected {expected[::-1]}"
+
+def test_where_stored_date(database):
+    got = list(Query(database.Reconcile).where("date=2025-12-19").select("date"))
+    assert got and all(row_date == date(2025, 12, 19) for row_date, in got), f"{got=}"
@@ -0,0 +1,28 @@
+# test_table.py
+
+r'''Run with "python -m pytest test_*.py".  These load beans.csv.
+'''
+
+from decimal import Decimal
+
+import pytest
+
+from table import load_database, Database
+
+
+@pytest.fixture
+def database():
+    load_database()
+    return Database
+
+
+def test_fork_update_referenced_table(database):
+    item = next(item for item in database.Items.values() if item.product is not None)
+    price = item.product.price
+    fork = database.fork()
+    with fork:
+        fork.update("Products", item.product.key(), price="99.99")
+        assert fork.Items[item.key()].product.price == Decimal("99.99"), \
+               f"fork sees {fork.Items[item.key()].product.price=}, expected 99.99"
+    assert database.Items[item.key()].product.price == price, \
+           f"parent sees {database.Items[item.key()].product.price=}, expected {price}"
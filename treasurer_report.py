@@ -21,7 +21,7 @@ def run():
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Months", "Accounts", "Starts", "Reconcile"))
 
     year = args.year
     if year < 2000:
@@ -39,21 +39,18 @@ def run():
     def find_final(end_date):
         r'''Find the final balance in the Reconcile table for end_date.
 
-        Returns index, recon row.
+        Returns the recon row.
         '''
-        index = Reconcile.last_date(end_date)   # index just past end_date
-       #print(f"{end_date=}, {start_index=}")
         error_msg = f"{end_date.strftime('%b %d, %y')}, month end final balance not found in Reconcile"
-        recon = Reconcile[index - 1]
-        if recon.account == 'cash' and recon.detail == 'w/starts':
+        recon = Reconcile.between(None, end_date).last()
+        if recon is not None and recon.account == 'cash' and recon.detail == 'w/starts':
            #print("found final balance")
-            return index - 1, recon
+            return recon
         raise AssertionError(error_msg)
 
     if end_date is not None:
-        final_index, final_balance = find_final(end_date)
+        final_balance = find_final(end_date)
     else:
-        final_index = len(Reconcile)
         last_recon = Reconcile[-1]
         if last_recon.account == 'cash' and last_recon.detail == 'w/starts':
             final_balance = last_recon
@@ -74,7 +71,7 @@ def run():
     report.new_row("title", f"as of {end_date.strftime('%b %d, %y')}", size=report.default_size)
 
     prev_end_date  = cur_month.start_date - timedelta(days=1)
-    prev_index, prev_balance = find_final(prev_end_date)
+    prev_balance = find_final(prev_end_date)
 
     prev_month_str = f"{abbr_month(prev_end_date.month)} '{str(prev_end_date.year)[2:]}"
 
@@ -152,8 +149,8 @@ def run():
 
     rev_details = {}
     exp_details = {}
-    for i in range(prev_index, final_index):  # loop from prev_index up to (but not including) final_index
-        recon = Reconcile[i]
+    # The month's rows.  The cash w/starts final balances are skipped below, as cash isn't in "Cash Flow".
+    for recon in Reconcile.between(cur_month.start_date, end_date):
         if recon.account == "revenue":
             if recon.detail not in rev_details:
                 templ = Row_template("l3", recon.detail)
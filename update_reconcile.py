@@ -1,7 +1,7 @@
 # update_reconcile.py
 
 r'''
-  - read Reconcile.csv into Reconcile table
+  - read Reconcile.csv into Reconcile table, skipping rows that were already imported (see Imports)
   - clears Reconcile.csv
 '''
 
@@ -20,14 +20,17 @@ def run():
     parser = argparse.ArgumentParser()
     parser.add_argument("--trial-run", "-t", action="store_true", default=False)
     parser.add_argument("--no-clear", "-n", action="store_true", default=False)
+    parser.add_argument("--force", "-f", action="store_true", default=False,
+                        help="also copy rows that were already imported")
     parser.add_argument("reconcile_csv_file", nargs='?', default=None)
 
     args = parser.parse_args()
 
-    load_database()
+    load_database(tables=("Reconcile", "Imports"))
     recon_file = args.reconcile_csv_file or "Reconcile.csv"
     print("Copying", recon_file, "into database")
-    load_csv(recon_file, from_scratch=False)
+    count = load_side_file(recon_file, Reconcile, once=not args.force)
+    print(f"Loaded {count} rows")
 
     if not args.trial_run:
         print("Saving database")
@@ -0,0 +1,209 @@
+# watch.py
+
+r'''Watches the side files, and copies new lines into the database as they are added.
+
+    python watch.py                    # Reconcile.csv and Inv-checklist.csv
+    python watch.py --code purchased   # code for the Inv-checklist.csv rows (default "count")
+
+The database is loaded once and kept in memory.  Each file is checked every --interval seconds.  Only
+the complete lines added since the last check are read (each file's offset is tracked), so a line that
+is still being typed isn't read until its newline is saved.
+
+Each batch of new lines is validated first (types, constraints, foreign keys and duplicate keys).  If there are no
+errors, the rows are added, recorded in the Imports table, and the database is saved.  If there are
+errors, nothing in the batch is added, and the whole file is read again once it changes (the rows that
+were already copied are skipped, see skip_imported in table.py).  This is also what happens when a file
+gets shorter, e.g., when update_reconcile.py clears it.
+
+Only appended lines are noticed.  Changes to lines that have already been copied are not.
+
+The Inv-checklist.csv rows are dated by the file's mtime when it is first read (again after it gets
+shorter), not by today.  Their import hashes include that date, so reading the file again on a later
+day (after a failed batch, or a reload) still skips the rows already copied.
+
+Other scripts may save the database while this is running.  Before each save, the database file is
+checked (see database_changed in table.py).  If it has changed, it is loaded again, and the side files
+are read again from the start, so the rows go into the new database instead of overwriting it.
+'''
+
+from collections import deque
+import csv
+import os.path
+import time
+
+from database import *
+from table import side_file_header, typed_rows, import_hashes, table_unique, database_changed, \
+                  Database_filename
+
+
+class side_file:
+    r'''A side file being watched, and its offset.
+
+    This is also the iterator for its csv_reader, returning the lines read so far that haven't been used,
+    so that csv_reader.line_num is the line number in the file.
+    '''
+    def __init__(self, filename, table, extra=None, ignore_unknown_cols=False):
+        self.filename = filename
+        self.table = table
+        self.extra = extra                  # fn(day) -> {name: value} added to each row, or None
+        self.day = None                     # date of the file's mtime when first read, see read_lines
+        self.ignore_unknown_cols = ignore_unknown_cols
+        self.failed = None                  # stat of the file when the last batch failed
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.lines = deque()
+        self.csv_reader = csv.reader(self, CSV_dialect, **CSV_format)
+        self.header = None
+        self.seen = {}                      # for import_hashes
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+    def read_lines(self):
+        r'''Reads the complete lines added since the last call.  Returns True if there are any.
+        '''
+        if not os.path.exists(self.filename):
+            return False
+        stat = os.stat(self.filename)
+        if self.failed is not None:
+            if (stat.st_size, stat.st_mtime_ns) == self.failed:
+                return False
+            self.failed = None
+            self.reset()
+        if stat.st_size < self.offset:
+            print(f"{self.filename}: got shorter, reading it again")
+            self.reset()
+            self.day = None
+        if stat.st_size == self.offset:
+            return False
+        if self.day is None:
+            self.day = date.fromtimestamp(stat.st_mtime)
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return False
+        self.lines.extend(data[:end].decode().splitlines(keepends=True))
+        self.offset += end
+        return True
+
+    def new_rows(self, extra):
+        r'''Returns the rows in the new lines.  Raises ValueError or AssertionError for bad lines.
+        '''
+        if self.header is None:
+            if len(self.lines) < 2:
+                # wait for the (optional) table name line and the header
+                self.offset -= sum(len(line.encode()) for line in self.lines)
+                self.lines.clear()
+                return []
+            row_class, self.header = side_file_header(self.csv_reader, self.table.row_class, self.filename)
+        rows = []
+        while self.lines:
+            rows.extend(typed_rows(self.csv_reader, self.table.row_class, self.header, extra,
+                                   self.ignore_unknown_cols, self.filename))
+        return rows
+
+    def ingest(self):
+        r'''Copies the new lines into the table.  Returns the number of rows added.
+        '''
+        if not self.read_lines():
+            return 0
+        try:
+            extra = self.extra(self.day) if self.extra is not None else None
+            rows = self.new_rows(extra)
+            imports = get_database().Imports
+            salt = '' if extra is None else str(extra['date'])
+            new = [(row, hash) for row, hash in import_hashes(rows, salt, self.seen)
+                   if hash not in imports]
+            errors = validate(self.table, [row for row, _ in new])
+            if errors:
+                raise ValueError("; ".join(errors))
+            self.table.insert_many([row for row, _ in new], skip_fk_check=True)
+        except (ValueError, AssertionError) as e:
+            stat = os.stat(self.filename)
+            self.failed = stat.st_size, stat.st_mtime_ns
+            print(f"ERROR: {e}")
+            print(f"{self.filename}: nothing copied, waiting for the file to be fixed")
+            return 0
+        # only recorded once the rows are in, so a failed batch is retried in full
+        today = date.today()
+        imports.insert_many([imports.row_class(hash=hash, table_name=row.table_name, date=today)
+                             for row, hash in new])
+        if len(new) < len(rows):
+            print(f"{self.filename}: skipped {len(rows) - len(new)} rows that were already imported")
+        return len(new)
+
+def validate(table, rows):
+    r'''Returns a list of error messages for adding rows to table.
+    '''
+    errors = table.constraint_errors(rows)
+    errors.extend(table.foreign_key_errors(rows))
+    if isinstance(table, table_unique):
+        keys = set()
+        for row in rows:
+            key = row.key()
+            if key in table or key in keys:
+                errors.append(f"{table.name}: duplicate key={key!r}")
+            keys.add(key)
+    return errors
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trial-run", "-t", action="store_true", default=False)
+    parser.add_argument("--interval", "-i", type=float, default=1.0, help="seconds between checks")
+    parser.add_argument("--code", "-c", default="count", help="code for the Inv-checklist.csv rows")
+    parser.add_argument("--reconcile-csv-file", "-r", default="Reconcile.csv")
+    parser.add_argument("--inv-csv-file", "-v", default="Inv-checklist.csv")
+
+    args = parser.parse_args()
+
+    tables = ("Reconcile", "Inventory", "Imports")
+    load_database(tables=tables)
+
+    files = (side_file(args.reconcile_csv_file, Reconcile),
+             side_file(args.inv_csv_file, Inventory,
+                       extra=lambda day: dict(date=day, code=args.code), ignore_unknown_cols=True))
+
+    print("Watching", ", ".join(file.filename for file in files), "(Ctrl-C to stop)")
+    try:
+        while True:
+            added = 0
+            for file in files:
+                count = file.ingest()
+                if count:
+                    print(f"{time.strftime('%H:%M:%S')} {file.filename}: copied {count} rows")
+                    added += count
+            if added:
+                if args.trial_run:
+                    print("Trial_run: Database not saved")
+                elif database_changed():
+                    print(f"{time.strftime('%H:%M:%S')} {Database_filename}: changed by another script, "
+                          "loading it again")
+                    load_database(tables=tables)
+                    for file in files:
+                        file.reset()
+                else:
+                    try:
+                        save_database()
+                    except ValueError as e:
+                        print(f"ERROR: {e}")
+                        print("Database not saved")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print()
+
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,75 @@
+# what_if.py
+
+r'''Shows how the orders (see create_orders.py) and P.O. total would change under a "what if".
+
+The what if is evaluated in a copy-on-write fork of the database (see Fork in table.py), so nothing is
+saved.
+
+    python what_if.py --purchase Eggs=2 --purchase Bacon=1
+    python what_if.py --served-fudge 1.6 --consumed-fudge 1.1
+'''
+
+from database import *
+
+
+def orders(cur_month, table_size):
+    r'''Returns {item: order}, total price of the orders.
+
+    Uses the active database (the fork, inside "with fork:").
+    '''
+    ans = {}
+    total = 0
+    database = get_database()
+    stock = database.Inventory.stock_levels()
+    for item in database.Items.values():
+        order = item.order_stats(cur_month, table_size, override=True, stock=stock[item.item]).order
+        ans[item.item] = order
+        if order:
+            total += order * item.product.price
+    return ans, total
+
+
+def run():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--purchase", "-p", action="append", default=[], help="item=num_pkgs, may be repeated")
+    parser.add_argument("--served-fudge", "-s", type=float, default=None)
+    parser.add_argument("--consumed-fudge", "-c", type=float, default=None)
+    parser.add_argument("--table-size", "-t", type=int, default=6)
+
+    args = parser.parse_args()
+
+    load_database(tables=("Months", "Items", "Inventory"))
+
+    today = date.today()
+    cur_month = Months.last_month()
+    base_orders, base_total = orders(cur_month, args.table_size)
+
+    fork = Database.fork()
+    for purchase in args.purchase:
+        item, num_pkgs = purchase.split('=')
+        key = today, item, "purchased"
+        if key in fork.Inventory:
+            fork.update("Inventory", key, num_pkgs=fork.Inventory[key].num_pkgs + float(num_pkgs))
+        else:
+            fork.insert("Inventory", date=today, item=item, code="purchased", num_pkgs=num_pkgs)
+    month_key = cur_month.year, cur_month.month
+    if args.served_fudge is not None:
+        fork.update("Months", month_key, served_fudge=args.served_fudge)
+    if args.consumed_fudge is not None:
+        fork.update("Months", month_key, consumed_fudge=args.consumed_fudge)
+    with fork:
+        what_if_orders, what_if_total = orders(fork.Months[month_key], args.table_size)
+
+    print(f"cur_month={cur_month.month_str}")
+    print("item                |base|what if")
+    for item, order in base_orders.items():
+        marker = "" if order == what_if_orders[item] else "  *"
+        print(f"{item:20}|{order:4}|{what_if_orders[item]:7}{marker}")
+    print(f"{'P.O. total':20}|{base_total:.2f}|{what_if_total:.2f}")
+
+
+
+if __name__ == "__main__":
+    run()